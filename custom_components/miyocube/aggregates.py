@@ -0,0 +1,189 @@
+import time
+from collections import deque
+
+# Statistics derived from each window, the rate of change is per hour
+AGGREGATE_STATS = ("min", "max", "mean", "rate")
+
+# Buckets per window, bounds memory and snapshot size independently of the update rate
+WINDOW_BUCKETS = 96
+
+def parse_windows(value) -> tuple:
+    """Parse a comma separated list of window lengths in hours, raises ValueError for anything else."""
+    hours = set()
+    for part in str(value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        window = int(part)
+        if not 1 <= window <= 24 * 31:
+            raise ValueError(f"Window out of range: {window}")
+        hours.add(window)
+    return tuple(sorted(hours))
+
+class RollingWindow:
+    """Min, max, mean and rate of change over the last window seconds in a fixed number of buckets.
+
+    Only changed values are dispatched, so every sample holds until the next one and the mean is weighted
+    by time. Each bucket keeps the min, max and area of the values held in it, so memory and the persisted
+    snapshot stay the same size whatever the update rate. The window starts at a bucket boundary.
+    """
+
+    __slots__ = ("_window", "_span", "_buckets", "_last_at", "_last")
+
+    def __init__(self, window: float):
+        self._window    = window
+        self._span      = window / WINDOW_BUCKETS
+        # [index, first_at, first, min, max, area, covered] in time order, first is the value held at first_at
+        self._buckets   = deque()
+        # Newest sample, held until now
+        self._last_at   = None
+        self._last      = None
+
+    def add(self, value: float, timestamp: float = None):
+        if timestamp is None:
+            timestamp = time.time()
+        if self._last_at is not None:
+            if timestamp < self._last_at:
+                return
+            self._advance(timestamp)
+        self._last_at   = timestamp
+        self._last      = value
+        self._hold(timestamp, timestamp, value)
+
+    def _hold(self, start: float, end: float, value: float):
+        """Account value as held from start to end in the buckets that period touches."""
+        span = self._span
+        start = max(start, end - self._window)
+        index = int(start // span)
+        while True:
+            bucket_end = (index + 1) * span
+            stop = min(end, bucket_end)
+            buckets = self._buckets
+            if buckets and buckets[-1][0] == index:
+                bucket = buckets[-1]
+            else:
+                bucket = [index, start, value, value, value, 0.0, 0.0]
+                buckets.append(bucket)
+            if value < bucket[3]:
+                bucket[3] = value
+            if value > bucket[4]:
+                bucket[4] = value
+            bucket[5] += value * (stop - start)
+            bucket[6] += stop - start
+            if end <= bucket_end:
+                return
+            start = stop
+            index += 1
+
+    def _advance(self, now: float):
+        """Account the newest value up to now and drop the buckets that left the window."""
+        if self._last_at is not None and now > self._last_at:
+            self._hold(self._last_at, now, self._last)
+            self._last_at = now
+        oldest = int(now // self._span) - WINDOW_BUCKETS
+        buckets = self._buckets
+        while buckets and buckets[0][0] <= oldest:
+            buckets.popleft()
+
+    def value(self, stat: str, now: float = None):
+        """Return one of AGGREGATE_STATS, None before the first sample."""
+        if now is None:
+            now = time.time()
+        self._advance(now)
+        buckets = self._buckets
+        if not buckets:
+            return None
+        if stat == "min":
+            return min(bucket[3] for bucket in buckets)
+        if stat == "max":
+            return max(bucket[4] for bucket in buckets)
+        if stat == "mean":
+            covered = sum(bucket[6] for bucket in buckets)
+            if covered <= 0:
+                return self._last
+            return sum(bucket[5] for bucket in buckets) / covered
+        _, first_at, first = buckets[0][:3]
+        if now <= first_at:
+            return None
+        return (self._last - first) / (now - first_at) * 3600
+
+    def snapshot(self) -> dict:
+        return {"buckets": [list(bucket) for bucket in self._buckets], "last": [self._last_at, self._last]}
+
+    def restore(self, data):
+        """Restore a snapshot, the newest value is taken as held while HA was stopped."""
+        if isinstance(data, dict):
+            self._buckets = deque(list(bucket) for bucket in data.get("buckets", ()))
+            self._last_at, self._last = data.get("last") or (None, None)
+        else:
+            # Raw samples written before the windows were bucketed
+            for timestamp, value in data:
+                self.add(value, timestamp)
+
+class RollingAggregates:
+    """Rolling windows per (device_id, state_type, hours), fed from the dispatcher independently of the entities showing them."""
+
+    def __init__(self, subscribe):
+        """
+        Parameters:
+            subscribe: MiyoDispatcher.subscribe, delivering the new values of a state
+        """
+        self._subscribe = subscribe
+        # (device_id, state_type) -> (windows by hours, unsubscribe)
+        self._feeds     = {}
+        # Persisted windows waiting to be created
+        self._restored  = {}
+
+    def window(self, device_id: str, state_type: str, hours: int, value=None) -> RollingWindow:
+        """Return the window of a state, created and subscribed on first use and starting with its current value."""
+        key = (device_id, state_type)
+        feed = self._feeds.get(key)
+        if feed is None:
+            windows = {}
+
+            def add(value):
+                if _is_number(value):
+                    now = time.time()
+                    for window in windows.values():
+                        window.add(value, now)
+
+            feed = self._feeds[key] = (windows, self._subscribe(device_id, state_type, add))
+
+        windows = feed[0]
+        window = windows.get(hours)
+        if window is None:
+            window = windows[hours] = RollingWindow(hours * 3600)
+            samples = self._restored.pop(_storage_key(device_id, state_type, hours), None)
+            if samples:
+                window.restore(samples)
+            if _is_number(value):
+                window.add(value)
+        return window
+
+    def discard(self, device_id: str):
+        """Drop the windows of a removed device."""
+        for key in [key for key in self._feeds if key[0] == device_id]:
+            _, unsubscribe = self._feeds.pop(key)
+            unsubscribe()
+
+    def snapshot(self) -> dict:
+        data = {}
+        for (device_id, state_type), (windows, _) in self._feeds.items():
+            for hours, window in windows.items():
+                data[_storage_key(device_id, state_type, hours)] = window.snapshot()
+        return data
+
+    def restore(self, data: dict):
+        """Keep persisted windows until the windows are created by the sensor platform, windows no longer configured are dropped with the next save."""
+        self._restored = dict(data or {})
+
+    def cancel(self):
+        """Stop feeding the windows, they stay available for a save still pending on unload."""
+        for _, unsubscribe in self._feeds.values():
+            unsubscribe()
+
+def _storage_key(device_id: str, state_type: str, hours: int) -> str:
+    return f"{device_id}|{state_type}|{hours}"
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import TypedDict
+
+import aiohttp
+from .utils import parse_circuits
+
+_LOGGER = logging.getLogger(__name__)
+
+class MiyoApiError(Exception):
+    """Raised when the MIYO Cube HTTP API cannot be reached or returns an unusable response."""
+
+class _RetryableError(Exception):
+    """A response worth another attempt, e.g. a 503 while the cube boots."""
+
+class CubeStatus(TypedDict, total=False):
+    uuid: str
+
+class SensorInfo(TypedDict):
+    id: str | None
+    ip: str | None
+    lastUpdate: str | None
+    stateTypes: dict
+
+class ValveInfo(TypedDict):
+    id: str | None
+    ip: str | None
+    lastUpdate: str | None
+    hardwareRevision: int | None
+    channel: int | None
+    stateTypes: dict
+
+class CircuitInfo(TypedDict):
+    id: str
+    name: str | None
+    stateTypes: dict
+    params: dict
+    sensor: SensorInfo
+    valves: list[ValveInfo]
+
+class MiyoApiClient:
+    """HTTP client for the MIYO Cube REST API, sharing one keep-alive session for all requests."""
+
+    def __init__(self, session: aiohttp.ClientSession, host: str, api_key: str | None = None, timeout: float = 10, retries: int = 2, backoff: float = 0.5):
+        """
+        Parameters:
+            session: Shared aiohttp session, e.g. from async_get_clientsession
+            host: Host or IP of the MIYO Cube
+            api_key: API key of the cube, not needed for the link request
+            timeout: Timeout per request attempt in seconds
+            retries: Number of retries after a failed attempt
+            backoff: Base delay in seconds, doubled for each retry
+        """
+        self._session   = session
+        self._host      = host
+        self._api_key   = api_key
+        self._timeout   = aiohttp.ClientTimeout(total=timeout)
+        self._retries   = retries
+        self._backoff   = backoff
+
+    async def _request(self, path: str, authenticated: bool = True) -> dict:
+        """GET a JSON document from the cube, retrying connection errors, timeouts, server errors and undecodable bodies."""
+        url = f"http://{self._host}{path}"
+        params = {"apiKey": self._api_key} if authenticated else None
+
+        for attempt in range(self._retries + 1):
+            try:
+                async with self._session.get(url, params=params, timeout=self._timeout) as resp:
+                    if 400 <= resp.status < 500:
+                        # A wrong path or api key does not get better by asking again
+                        raise MiyoApiError(f"HTTP {resp.status} from {path}")
+                    if resp.status != 200:
+                        raise _RetryableError(f"HTTP {resp.status}")
+                    # E.g. an HTML error page while the cube reboots
+                    return await resp.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, _RetryableError) as e:
+                if attempt >= self._retries:
+                    raise MiyoApiError(f"Error requesting {path} from {self._host}: {e!r}") from e
+                delay = self._backoff * 2 ** attempt
+                _LOGGER.debug("Request %s to %s failed (%r), retrying in %ss", path, self._host, e, delay)
+                await asyncio.sleep(delay)
+
+    async def async_get_status(self) -> CubeStatus:
+        """Query basic info from the MIYO Cube."""
+        data = await self._request("/api/System/status")
+        if not isinstance(data, dict) or "params" not in data:
+            raise MiyoApiError("No 'params' in cube status response")
+        return data["params"]
+
+    async def async_get_circuits(self) -> list[CircuitInfo]:
+        """Query all circuits from the MIYO Cube."""
+        data = await self._request("/api/circuit/all")
+        try:
+            return parse_circuits(data)
+        except Exception as e:
+            raise MiyoApiError(f"Error parsing circuits data: {e}") from e
+
+    async def async_get_api_key(self) -> str | None:
+        """Query the MIYO Cube for an API key, the hardware button must have been pressed."""
+        data = await self._request("/api/link", authenticated=False)
+        return data.get("apiKey") if isinstance(data, dict) else None
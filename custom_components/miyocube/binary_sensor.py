@@ -1,53 +1,66 @@
 from __future__ import annotations
-from homeassistant.components.binary_sensor import BinarySensorEntity
-from homeassistant.const import PERCENTAGE, UnitOfTemperature, UnitOfElectricPotential, LIGHT_LUX
+from homeassistant.components.binary_sensor import BinarySensorEntity, BinarySensorEntityDescription, BinarySensorDeviceClass
 from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from .const import DOMAIN
-from .utils import convert_statetype_value, camel_to_snake
+from .utils import camel_to_snake
 import logging
 import datetime
 
 _LOGGER = logging.getLogger(__name__)
 
+# Static description per state type, resolved once when the entity is created
+BINARY_SENSOR_DESCRIPTIONS = {
+    description.key: description for description in (
+        BinarySensorEntityDescription(key="irrigationWasStarted", translation_key="irrigation_was_started", icon="mdi:information-slab-circle"),
+        BinarySensorEntityDescription(key="valveStatus", translation_key="valve_status", device_class=BinarySensorDeviceClass.OPENING, icon="mdi:pipe-valve"),
+        BinarySensorEntityDescription(key="valve2Status", translation_key="valve2_status", device_class=BinarySensorDeviceClass.OPENING, icon="mdi:pipe-valve"),
+    )
+}
+
 async def async_setup_entry(hass, entry, async_add_entities):
-    """Set up the sensor entity from config entry."""    
+    """Set up the binary sensor entities from config entry."""
+    hub = hass.data[DOMAIN][entry.entry_id]
+    # Adds the entities of the known circuits now and of circuits or devices appearing later
+    hub.register_platform(_circuit_entities, async_add_entities)
 
-    circuits_data = hass.data[DOMAIN][entry.entry_id]
+def _circuit_entities(hub, circuit) -> list:
+    """Create the binary sensor entities of one circuit and its devices."""
     entities = []
-    cube_id = entry.data.get('cube_uuid')
+    cube_id = hub.cube_id
 
-    for circuit in circuits_data:
-        
-        circuit_id      = circuit["id"]
-        circuit_name    = f"{circuit["name"]}"
+    circuit_id      = circuit["id"]
+    circuit_name    = f"{circuit["name"]}"
 
-        entities.append(MiyoBinarySensor(hass, cube_id, circuit_id, circuit_id, "circuit", circuit_name, "irrigationWasStarted", circuit["stateTypes"].get("irrigationWasStarted", None)))
+    entities.append(MiyoBinarySensor(hub, cube_id, circuit_id, circuit_id, "circuit", circuit_name, "irrigationWasStarted"))
 
-        valves = circuit.get("valves", [])
-        for valve in valves:
-            if valve.get("id"):
-                valve_id = valve["id"]
-                valve_ip = valve["ip"]
-                valve_hardware_revision = valve.get("hardwareRevision", 0)
+    valves = circuit.get("valves", [])
+    for valve in valves:
+        if valve.get("id"):
+            valve_id = valve["id"]
+            valve_ip = valve["ip"]
+            valve_hardware_revision = valve.get("hardwareRevision", 0)
 
-                device_name = f"{valve_ip.replace('%zmd0', '')[-7:]}"                
+            device_name = f"{valve_ip.replace('%zmd0', '')[-7:]}"                
 
-                if valve_hardware_revision == 1:
-                    entities.append(MiyoBinarySensor(hass, cube_id, circuit_id, valve_id, "valve", device_name, "valve2Status", valve["stateTypes"].get("valve2Status", None)))
+            if valve_hardware_revision == 1:
+                entities.append(MiyoBinarySensor(hub, cube_id, circuit_id, valve_id, "valve", device_name, "valve2Status"))
 
-                entities.append(MiyoBinarySensor(hass, cube_id, circuit_id, valve_id, "valve", device_name, "valveStatus", valve["stateTypes"].get("valveStatus", None)))
+            entities.append(MiyoBinarySensor(hub, cube_id, circuit_id, valve_id, "valve", device_name, "valveStatus"))
 
-    async_add_entities(entities)
+    return entities
 
     
 
 class MiyoBinarySensor(BinarySensorEntity):
     """BinarySensor receiving updates via WS."""
 
-    def __init__(self, hass, cube_id: str, circuit_id: str, device_id: str, device_type: str, device_name: str, state: str, init_value = None):
+    _attr_should_poll = False
+
+    def __init__(self, hub, cube_id: str, circuit_id: str, device_id: str, device_type: str, device_name: str, state: str):
         """
         Parameters:
-            hass: HomeAssistant core object
+            hub: MiyoHub of the config entry
             cube_id: ID of the Miyo cube
             circuit_id: ID of the circuit
             device_id: ID of the sensor device
@@ -55,95 +68,53 @@ class MiyoBinarySensor(BinarySensorEntity):
             deviceName: Name of the device
             state: Type of state this sensor represents (e.g., "moisture", "temperature")            
         """
-        self.hass = hass
+        self.hass = hub.hass
+        self._hub = hub
         self._device_id         = device_id
         self._statetype         = state
-        self._state             = None
         self._device_name       = device_name
         self._device_type       = device_type        
         self._circuit_id        = circuit_id
 
         self._attr_unique_id    = f"{device_id}_{state}"
         self._attr_has_entity_name = True
-        self._attr_translation_key = camel_to_snake(state)
-
-        if init_value is not None: 
-            self._state = convert_statetype_value(self._statetype, init_value)      
+        self._attr_device_info  = hub.device_info(device_id, device_type, device_name, circuit_id)
+        self.entity_description = BINARY_SENSOR_DESCRIPTIONS.get(state) or BinarySensorEntityDescription(key=state, translation_key=camel_to_snake(state), icon="mdi:sensor")
 
     #
     #  ---------- HA Entity Properties ----------
     #
 
     @property
-    def native_value(self):
-        return self._state
-
-    @property
-    def device_class(self):
-        if self._statetype == "valveStatus" or self._statetype == "valve2Status":
-            return "opening"
-        else:
-            return None
-
-    @property
-    def icon(self):
-        if self._statetype == "irrigationWasStarted":
-            return "mdi:information-slab-circle"
-        elif self._statetype == "valveStatus" or self._statetype == "valve2Status":
-            return "mdi:pipe-valve"
-        else:
-            return "mdi:sensor"
+    def available(self) -> bool:
+        """Unavailable while the hub only has values restored from its snapshot."""
+        return self._hub.available
 
     @property
-    def native_unit_of_measurement(self):
-        return None
-
-    @property
-    def device_info(self):
-        """Associate this entity with a HA device."""
-        device_info = {
-            "identifiers": {(DOMAIN, self._device_id)},
-            "translation_key": camel_to_snake(self._device_type),
-            "translation_placeholders": {"id": self._device_name},
-            "manufacturer": "MIYO",
-            "model": "Smart Irrigation"
-        }
-
-        if self._device_type != "circuit":
-            device_info["via_device"] = (DOMAIN, self._circuit_id)
-
-        return device_info
+    def native_value(self):
+        return self._hub.store.get(self._device_id, self._statetype)
 
     #
     #  ---------- WS Handling ----------
     #
     @callback
-    async def _handle_update(self, event):
-        updates = event.data
-
-        for data in updates:
-            if "device_id" in data and "state_type" in data and "value" in data:
-                device_id = data["device_id"]
-                state_type = data["state_type"]
-                value = data["value"]
-
-                if device_id == self._device_id and state_type == self._statetype:
-                    _LOGGER.info(f"Direct update for device {device_id} update state {state_type} to {value} on {self._device_id} {self._statetype}")
-                    self._state = value
-                    self.async_write_ha_state()
-        
+    def _handle_update(self, value):
+        """Handle a new value for this entity's device and state type."""
+        _LOGGER.debug("Direct update for device %s update state %s to %s", self._device_id, self._statetype, value)
+        self.async_write_ha_state()
 
     async def async_added_to_hass(self):
-        """Subscribe to WS event when entity is added."""
-        self._unsub = self.hass.bus.async_listen(f"{DOMAIN}_update", self._handle_update)
+        """Subscribe to WS updates for this entity when it is added."""
+        self._unsub = self._hub.dispatcher.subscribe(self._device_id, self._statetype, self._handle_update)
+        self.async_on_remove(async_dispatcher_connect(self.hass, self._hub.signal_available, self.async_write_ha_state))
 
     
     @property
     def is_on(self):
-        return self._state is True
+        return self._hub.store.get(self._device_id, self._statetype) is True
 
     async def async_will_remove_from_hass(self):
-        """Unsubscribe from WS event when entity is removed."""
+        """Unsubscribe from WS updates when entity is removed."""
         if hasattr(self, "_unsub") and self._unsub is not None:
             self._unsub()
             self._unsub = None
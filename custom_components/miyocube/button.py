@@ -1,40 +1,54 @@
 from __future__ import annotations
-from homeassistant.components.button import ButtonEntity
+from homeassistant.components.button import ButtonEntity, ButtonEntityDescription
 from homeassistant.core import callback
-from homeassistant.helpers.entity_registry import async_get as async_get_entity_registry
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.exceptions import HomeAssistantError
 from .const import DOMAIN
 import logging
 import datetime
 from .utils import convert_statetype_value, camel_to_snake
+from .ws_client import WSCommandError
 
 _LOGGER = logging.getLogger(__name__)
 
+# Static description per button type, resolved once when the entity is created
+BUTTON_DESCRIPTIONS = {
+    description.key: description for description in (
+        ButtonEntityDescription(key="startIrrigation", translation_key="start_irrigation", icon="mdi:water"),
+        ButtonEntityDescription(key="stopIrrigation", translation_key="stop_irrigation", icon="mdi:water-off"),
+    )
+}
+
 async def async_setup_entry(hass, entry, async_add_entities):
-    """Set up the sensor entity from config entry."""    
+    """Set up the button entities from config entry."""
+    hub = hass.data[DOMAIN][entry.entry_id]
+    # Adds the entities of the known circuits now and of circuits or devices appearing later
+    hub.register_platform(_circuit_entities, async_add_entities)
 
-    circuits_data = hass.data[DOMAIN][entry.entry_id]
+def _circuit_entities(hub, circuit) -> list:
+    """Create the button entities of one circuit and its devices."""
     entities = []
-    cube_id = entry.data.get('cube_uuid')
+    cube_id = hub.cube_id
 
-    for circuit in circuits_data:
-        
-        circuit_id      = circuit["id"]
-        circuit_name    = f"{circuit["name"]}"
+    circuit_id      = circuit["id"]
+    circuit_name    = f"{circuit["name"]}"
 
-        entities.append(MiyoButton(hass, cube_id, circuit_id, circuit_id, "circuit", circuit_name, "startIrrigation"))
-        entities.append(MiyoButton(hass, cube_id, circuit_id, circuit_id, "circuit", circuit_name, "stopIrrigation"))
+    entities.append(MiyoButton(hub, cube_id, circuit_id, circuit_id, "circuit", circuit_name, "startIrrigation"))
+    entities.append(MiyoButton(hub, cube_id, circuit_id, circuit_id, "circuit", circuit_name, "stopIrrigation"))
 
-    async_add_entities(entities)
+    return entities
 
     
 
 class MiyoButton(ButtonEntity):
     """Button receiving updates via WS."""
 
-    def __init__(self, hass, cube_id: str, circuit_id: str, device_id: str, device_type: str, device_name: str, state: str):
+    _attr_should_poll = False
+
+    def __init__(self, hub, cube_id: str, circuit_id: str, device_id: str, device_type: str, device_name: str, state: str):
         """
         Parameters:
-            hass: HomeAssistant core object
+            hub: MiyoHub of the config entry
             cube_id: ID of the Miyo cube
             circuit_id: ID of the circuit
             device_id: ID of the sensor device
@@ -42,7 +56,8 @@ class MiyoButton(ButtonEntity):
             deviceName: Name of the device
             state: Type of state this sensor represents (e.g., "moisture", "temperature")            
         """
-        self.hass = hass
+        self.hass = hub.hass
+        self._hub = hub
         self._device_id         = device_id
         self._statetype         = state
         self._device_name       = device_name
@@ -51,44 +66,22 @@ class MiyoButton(ButtonEntity):
 
         self._attr_unique_id    = f"{device_id}_{state}"
         self._attr_has_entity_name = True
-        self._attr_translation_key = camel_to_snake(state)
+        self._attr_device_info  = hub.device_info(device_id, device_type, device_name, circuit_id)
+        self._circuit           = hub.circuit(circuit_id)
+        self.entity_description = BUTTON_DESCRIPTIONS.get(state) or ButtonEntityDescription(key=state, translation_key=camel_to_snake(state), icon="mdi:sensor")
 
     #
     #  ---------- HA Entity Properties ----------
     #
 
     @property
-    def native_value(self):
-        return self._state
-
-    @property
-    def device_class(self):
-        return "button"
-
-    @property
-    def icon(self):
-        if self._statetype == "startIrrigation":
-            return "mdi:water"
-        elif self._statetype == "stopIrrigation":
-            return "mdi:water-off"
-        else:
-            return "mdi:sensor"
+    def available(self) -> bool:
+        """Unavailable while the hub only has values restored from its snapshot."""
+        return self._hub.available
 
-    @property
-    def device_info(self):
-        """Associate this entity with a HA device."""
-        device_info = {
-            "identifiers": {(DOMAIN, self._device_id)},
-            "translation_key": camel_to_snake(self._device_type)    ,
-            "translation_placeholders": {"id": self._device_name},
-            "manufacturer": "MIYO",
-            "model": "Smart Irrigation"
-        }
-
-        if self._device_type != "circuit":
-            device_info["via_device"] = (DOMAIN, self._circuit_id)
-        
-        return device_info
+    async def async_added_to_hass(self):
+        """Follow the availability of the hub."""
+        self.async_on_remove(async_dispatcher_connect(self.hass, self._hub.signal_available, self.async_write_ha_state))
 
     #
     #  ---------- WS Handling ----------
@@ -96,39 +89,19 @@ class MiyoButton(ButtonEntity):
 
     async def async_press(self, **kwargs):
         """Handle the button press."""
-
-
         if self._statetype == "startIrrigation":
-            duration = None
-
-            entity_registry = async_get_entity_registry(self.hass)
-            entry = entity_registry.async_get_entity_id("number", DOMAIN, self._circuit_id + "_duration")
-            
-            duration_state = None
-            if entry:
-                duration_state = self.hass.states.get(entry)
-            
-            if duration_state is not None and duration_state.state != "unknown":
-                duration = int(float(duration_state.state))
-
-            if duration is not None:
-                ws_client = self.hass.data[DOMAIN]["ws_client"]
-                await ws_client.send({
-                    "method": "Circuit.irrigation",            
-                    "params": {
-                        "circuitId": self._circuit_id,
-                        "mode": "start",
-                        "duration": duration
-                    }
-                })
+            # Set by the duration number of the circuit, restored across restarts
+            duration = self._circuit.duration
+            if duration is None:
+                raise HomeAssistantError("No irrigation duration set for this circuit")
+
+            await self._async_send_irrigation("start", duration)
         elif self._statetype == "stopIrrigation":
-        
-            ws_client = self.hass.data[DOMAIN]["ws_client"]            
-            await ws_client.send({
-                "method": "Circuit.irrigation",            
-                "params": {
-                    "circuitId": self._circuit_id,
-                    "mode": "stop"
-                }
-            })
-        
+            await self._async_send_irrigation("stop")
+
+    async def _async_send_irrigation(self, mode: str, duration: int = None):
+        """Send a Circuit.irrigation command and wait for the cube to acknowledge it."""
+        try:
+            await self._hub.async_irrigation(self._circuit_id, mode, duration)
+        except WSCommandError as e:
+            raise HomeAssistantError(f"MIYO Cube did not accept irrigation {mode}: {e}") from e
@@ -0,0 +1,9 @@
+class MiyoCircuit:
+    """Runtime object of one circuit, shared by its entities so a button press reads the duration directly."""
+
+    __slots__ = ("circuit_id", "duration")
+
+    def __init__(self, circuit_id: str):
+        self.circuit_id = circuit_id
+        # Manual irrigation duration in minutes, owned by the duration number entity
+        self.duration   = None
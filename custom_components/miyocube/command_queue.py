@@ -0,0 +1,108 @@
+import asyncio
+from collections import deque
+
+class OutboundCommand:
+    """A command waiting to be sent to the cube, completed with the params of its response."""
+
+    __slots__ = ("data", "future", "key", "priority", "idempotent", "sent", "expiry")
+
+    def __init__(self, data: dict, future, key=None, priority: bool = False, idempotent: bool = True):
+        """
+        Parameters:
+            data: Method and params of the command, id and api key are added when it is sent
+            future: Completed with the response params or failed with a WSCommandError
+            key: Commands with the same key, e.g. the circuit id, are sent one after another
+            priority: Sent before all other commands and replaces queued commands of the same method and key
+            idempotent: Whether the command may be sent again if the connection dropped before its response
+        """
+        self.data       = data
+        self.future     = future
+        self.key        = key
+        self.priority   = priority
+        self.idempotent = idempotent
+        self.sent       = False
+        self.expiry     = None
+
+class CommandQueue:
+    """Commands waiting for the connection, priority ones first, at most one in flight per key."""
+
+    def __init__(self, metrics=None):
+        self._urgent    = deque()
+        self._normal    = deque()
+        self._inflight  = set()
+        self._metrics   = metrics
+        self.event      = asyncio.Event()
+
+    def __len__(self):
+        return len(self._urgent) + len(self._normal)
+
+    def put(self, command: OutboundCommand, front: bool = False):
+        """Queue a command, front=True puts a command back that has to be retried."""
+        queue = self._urgent if command.priority else self._normal
+        if front:
+            queue.appendleft(command)
+        else:
+            queue.append(command)
+        self._changed()
+
+    def superseded(self, command: OutboundCommand) -> list:
+        """Remove and return the unsent commands a priority command replaces."""
+        method = command.data.get("method")
+        superseded = []
+        for queue in (self._urgent, self._normal):
+            for queued in [queued for queued in queue if queued.key == command.key and queued.data.get("method") == method]:
+                queue.remove(queued)
+                superseded.append(queued)
+        self._changed()
+        return superseded
+
+    def next_ready(self):
+        """Take the first command whose key has nothing in flight, None if there is none."""
+        for queue in (self._urgent, self._normal):
+            for command in queue:
+                if command.future.done():
+                    continue
+                if command.key is not None and command.key in self._inflight:
+                    continue
+                queue.remove(command)
+                if command.key is not None:
+                    self._inflight.add(command.key)
+                self._prune()
+                return command
+        self._prune()
+        return None
+
+    def release(self, command: OutboundCommand):
+        """The command got its response or failed, the next one with its key may go."""
+        self._inflight.discard(command.key)
+        self.event.set()
+
+    def remove(self, command: OutboundCommand):
+        for queue in (self._urgent, self._normal):
+            try:
+                queue.remove(command)
+            except ValueError:
+                continue
+        self._changed()
+
+    def _prune(self):
+        """Drop commands that expired or were cancelled by their caller."""
+        for queue in (self._urgent, self._normal):
+            while queue and queue[0].future.done():
+                queue.popleft()
+        self._changed(wake=False)
+
+    def _changed(self, wake: bool = True):
+        if self._metrics:
+            self._metrics.command_queue_depth = len(self)
+        if wake:
+            self.event.set()
+
+    def clear(self):
+        """Drop everything, e.g. when the client stops."""
+        commands = list(self._urgent) + list(self._normal)
+        self._urgent.clear()
+        self._normal.clear()
+        self._inflight.clear()
+        self._changed(wake=False)
+        return commands
@@ -2,7 +2,24 @@ import logging
 import voluptuous as vol
 from homeassistant import config_entries
 from homeassistant.const import CONF_HOST
-from .const import DOMAIN
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from .const import (
+    DOMAIN,
+    CONF_COALESCE_WINDOW, DEFAULT_COALESCE_WINDOW,
+    CONF_TRACE_SIZE, DEFAULT_TRACE_SIZE,
+    CONF_TRACE_SAMPLE_RATE, DEFAULT_TRACE_SAMPLE_RATE,
+    CONF_QUEUE_SIZE, DEFAULT_QUEUE_SIZE,
+    CONF_OVERFLOW_POLICY, DEFAULT_OVERFLOW_POLICY,
+    CONF_PING_INTERVAL, DEFAULT_PING_INTERVAL,
+    CONF_PONG_TIMEOUT, DEFAULT_PONG_TIMEOUT,
+    DEADBAND_OPTIONS,
+    CONF_MIN_WRITE_INTERVAL, DEFAULT_MIN_WRITE_INTERVAL,
+    CONF_WRITE_HEARTBEAT, DEFAULT_WRITE_HEARTBEAT,
+    CONF_AGGREGATE_WINDOWS, DEFAULT_AGGREGATE_WINDOWS,
+)
+from .api import MiyoApiClient, MiyoApiError
+from .receive_queue import OVERFLOW_POLICIES
+from .aggregates import parse_windows
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -24,31 +41,26 @@ async def async_discover_miyo_cube():
         server = device["Server"]
         host = device["_host"]
         if "miyocube" in server:
-            _LOGGER.info(f"Discovered MIYO Cube at {host}")
+            _LOGGER.info("Discovered MIYO Cube at %s", host)
             found_host = host
             return
 
     try:
         await async_search(device_callback)
     except Exception as e:
-        _LOGGER.error(f"Error during MIYO Cube discovery: {e}")
+        _LOGGER.error("Error during MIYO Cube discovery: %s", e)
         return None
 
     return found_host
 
 # Function to get API key from MIYO Cube
-async def async_get_api_key(host):
+async def async_get_api_key(hass, host):
     """Query the MIYO Cube for an API key (simulate button press)."""
-    import aiohttp
-    url = f"http://{host}/api/link"
+    api = MiyoApiClient(async_get_clientsession(hass), host)
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=10) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    return data.get("apiKey")
-    except Exception as e:
-        _LOGGER.error(f"Error fetching API key from {host}: {e}")
+        return await api.async_get_api_key()
+    except MiyoApiError as e:
+        _LOGGER.error("Error fetching API key from %s: %s", host, e)
     return None
 
 # Options flow handler for updating configuration options
@@ -63,7 +75,18 @@ class MiyocubeOptionsFlowHandler(config_entries.OptionsFlow):
     async def async_step_init(self, user_input=None):
         errors = {}
         if user_input is not None:
-            return self.async_create_entry(data=user_input)
+            try:
+                parse_windows(user_input.get(CONF_AGGREGATE_WINDOWS))
+            except ValueError:
+                errors[CONF_AGGREGATE_WINDOWS] = "invalid_windows"
+            else:
+                return self.async_create_entry(data=user_input)
+
+        options = self.config_entry.options
+        deadbands = {
+            vol.Optional(option, default=options.get(option, default)): vol.All(vol.Coerce(float), vol.Range(min=0, max=100 if relative else 1000))
+            for option, default, relative in DEADBAND_OPTIONS.values()
+        }
 
         return self.async_show_form(
             step_id="init",
@@ -76,6 +99,47 @@ class MiyocubeOptionsFlowHandler(config_entries.OptionsFlow):
                     CONF_API_KEY,
                     default=self.config_entry.options.get(CONF_API_KEY, self.config_entry.data.get(CONF_API_KEY, ""))
                 ): str,
+                vol.Optional(
+                    CONF_COALESCE_WINDOW,
+                    default=self.config_entry.options.get(CONF_COALESCE_WINDOW, DEFAULT_COALESCE_WINDOW)
+                ): vol.All(vol.Coerce(int), vol.Range(min=0, max=5000)),
+                vol.Optional(
+                    CONF_TRACE_SIZE,
+                    default=self.config_entry.options.get(CONF_TRACE_SIZE, DEFAULT_TRACE_SIZE)
+                ): vol.All(vol.Coerce(int), vol.Range(min=0, max=10000)),
+                vol.Optional(
+                    CONF_TRACE_SAMPLE_RATE,
+                    default=self.config_entry.options.get(CONF_TRACE_SAMPLE_RATE, DEFAULT_TRACE_SAMPLE_RATE)
+                ): vol.All(vol.Coerce(float), vol.Range(min=0, max=1)),
+                vol.Optional(
+                    CONF_QUEUE_SIZE,
+                    default=self.config_entry.options.get(CONF_QUEUE_SIZE, DEFAULT_QUEUE_SIZE)
+                ): vol.All(vol.Coerce(int), vol.Range(min=10, max=100000)),
+                vol.Optional(
+                    CONF_OVERFLOW_POLICY,
+                    default=self.config_entry.options.get(CONF_OVERFLOW_POLICY, DEFAULT_OVERFLOW_POLICY)
+                ): vol.In(OVERFLOW_POLICIES),
+                vol.Optional(
+                    CONF_PING_INTERVAL,
+                    default=self.config_entry.options.get(CONF_PING_INTERVAL, DEFAULT_PING_INTERVAL)
+                ): vol.All(vol.Coerce(int), vol.Range(min=1, max=300)),
+                vol.Optional(
+                    CONF_PONG_TIMEOUT,
+                    default=self.config_entry.options.get(CONF_PONG_TIMEOUT, DEFAULT_PONG_TIMEOUT)
+                ): vol.All(vol.Coerce(int), vol.Range(min=1, max=60)),
+                **deadbands,
+                vol.Optional(
+                    CONF_MIN_WRITE_INTERVAL,
+                    default=self.config_entry.options.get(CONF_MIN_WRITE_INTERVAL, DEFAULT_MIN_WRITE_INTERVAL)
+                ): vol.All(vol.Coerce(int), vol.Range(min=0, max=3600)),
+                vol.Optional(
+                    CONF_WRITE_HEARTBEAT,
+                    default=self.config_entry.options.get(CONF_WRITE_HEARTBEAT, DEFAULT_WRITE_HEARTBEAT)
+                ): vol.All(vol.Coerce(int), vol.Range(min=0, max=86400)),
+                vol.Optional(
+                    CONF_AGGREGATE_WINDOWS,
+                    default=self.config_entry.options.get(CONF_AGGREGATE_WINDOWS, DEFAULT_AGGREGATE_WINDOWS)
+                ): str,
             }),
             errors=errors,
         )
@@ -116,7 +180,7 @@ class MiyocubeConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         api_key = None
 
         if host:
-            api_key = await async_get_api_key(host)
+            api_key = await async_get_api_key(self.hass, host)
             if api_key:
                 return self.async_create_entry(
                     title="MIYO Cube",
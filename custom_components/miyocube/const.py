@@ -1 +1,44 @@
 DOMAIN = 'miyocube'
+
+CONF_COALESCE_WINDOW = "coalesce_window"
+DEFAULT_COALESCE_WINDOW = 0
+
+CONF_TRACE_SIZE = "trace_size"
+DEFAULT_TRACE_SIZE = 0
+
+CONF_TRACE_SAMPLE_RATE = "trace_sample_rate"
+DEFAULT_TRACE_SAMPLE_RATE = 1.0
+
+CONF_QUEUE_SIZE = "queue_size"
+DEFAULT_QUEUE_SIZE = 1000
+
+CONF_OVERFLOW_POLICY = "overflow_policy"
+DEFAULT_OVERFLOW_POLICY = "coalesce"
+
+CONF_PING_INTERVAL = "ping_interval"
+DEFAULT_PING_INTERVAL = 20
+
+CONF_PONG_TIMEOUT = "pong_timeout"
+DEFAULT_PONG_TIMEOUT = 10
+
+# State type -> (option, default, relative) of the deadband within which changes are not written,
+# off by default so upgrading does not change what gets recorded
+DEADBAND_OPTIONS = {
+    "brightness": ("brightness_deadband", 0.0, True),
+    "solarVoltage": ("solar_voltage_deadband", 0.0, False),
+    "temperature": ("temperature_deadband", 0.0, False),
+    "moisture": ("moisture_deadband", 0.0, False),
+}
+
+CONF_MIN_WRITE_INTERVAL = "min_write_interval"
+DEFAULT_MIN_WRITE_INTERVAL = 0
+
+CONF_WRITE_HEARTBEAT = "write_heartbeat"
+DEFAULT_WRITE_HEARTBEAT = 3600
+
+# Comma separated window lengths in hours of the rolling min, max, mean and rate sensors, empty disables them
+CONF_AGGREGATE_WINDOWS = "aggregate_windows"
+DEFAULT_AGGREGATE_WINDOWS = ""
+
+# State types of the soil sensors that get rolling aggregate sensors
+AGGREGATE_STATE_TYPES = ("moisture", "temperature", "brightness")
@@ -0,0 +1,26 @@
+from __future__ import annotations
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from .const import DOMAIN
+
+TO_REDACT = {"api_key"}
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict:
+    """Return diagnostics for a config entry, including the sampled WS message trace."""
+    hub = hass.data[DOMAIN][entry.entry_id]
+    return {
+        "entry": {
+            "data": async_redact_data(dict(entry.data), TO_REDACT),
+            "options": async_redact_data(dict(entry.options), TO_REDACT),
+        },
+        "connection": dict(hub.ws_client.reconnect_state, stale=hub.stale),
+        "metrics": hub.metrics.as_dict(),
+        "scheduler": hub.scheduler.state,
+        "state": hub.store.snapshot(),
+        "trace": {
+            "enabled": hub.trace.enabled,
+            "seen": hub.trace.seen,
+            "messages": hub.trace.as_list(),
+        },
+    }
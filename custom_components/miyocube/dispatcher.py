@@ -0,0 +1,113 @@
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+class MiyoDispatcher:
+    """Write parsed WS updates to the state store and notify the entities subscribed to a (device_id, state_type) pair."""
+
+    def __init__(self, store):
+        """
+        Parameters:
+            store: MiyoStateStore holding the last known value of every state
+        """
+        self._listeners = {}
+        self._store = store
+
+    def subscribe(self, device_id: str, state_type: str, listener):
+        """Register a listener called with the new value, returns an unsubscribe function."""
+        key = (device_id, state_type)
+        self._listeners.setdefault(key, []).append(listener)
+
+        def unsubscribe():
+            listeners = self._listeners.get(key)
+            if listeners is None:
+                return
+            try:
+                listeners.remove(listener)
+            except ValueError:
+                return
+            if not listeners:
+                del self._listeners[key]
+
+        return unsubscribe
+
+    def seed(self, updates):
+        """Record known values without notifying listeners, e.g. from the initial topology."""
+        for data in updates:
+            self._store.set(data["device_id"], data["state_type"], data.get("value"))
+
+    def diff(self, updates):
+        """Return only the updates whose value differs from the last known one."""
+        differs = self._store.differs
+        return [data for data in updates if differs(data["device_id"], data["state_type"], data.get("value"))]
+
+    def dispatch(self, updates):
+        """Deliver each update only to the listeners of its (device_id, state_type), unless the value is unchanged."""
+        if not updates:
+            return
+
+        for data in updates:
+            device_id = data.get("device_id")
+            state_type = data.get("state_type")
+            if device_id is None or state_type is None:
+                continue
+            value = data.get("value")
+            if not self._store.set(device_id, state_type, value):
+                continue
+            listeners = self._listeners.get((device_id, state_type))
+            if not listeners:
+                continue
+            # Copy, a listener may unsubscribe while being called
+            for listener in tuple(listeners):
+                try:
+                    listener(value)
+                except Exception:
+                    _LOGGER.exception("Error dispatching update %s", data)
+
+class UpdateCoalescer:
+    """Collect parsed updates for a short window and hand them over as one deduplicated batch."""
+
+    def __init__(self, loop, dispatch, window_ms: int = 0):
+        """
+        Parameters:
+            loop: Event loop used to schedule the flush
+            dispatch: Callable receiving the batch of updates
+            window_ms: Coalescing window in milliseconds, 0 dispatches immediately
+        """
+        self._loop      = loop
+        self._dispatch  = dispatch
+        self._window    = max(window_ms, 0) / 1000
+        self._pending   = {}
+        self._handle    = None
+
+    def add(self, updates):
+        """Queue updates, the last value per (device_id, state_type) wins."""
+        if not updates:
+            return
+        if not self._window:
+            self._dispatch(updates)
+            return
+
+        for data in updates:
+            self._pending[(data.get("device_id"), data.get("state_type"))] = data
+
+        if self._handle is None:
+            self._handle = self._loop.call_later(self._window, self.flush)
+
+    def flush(self):
+        """Dispatch everything collected so far."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if not self._pending:
+            return
+        batch = list(self._pending.values())
+        self._pending.clear()
+        self._dispatch(batch)
+
+    def cancel(self):
+        """Drop pending updates and the scheduled flush."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._pending.clear()
@@ -0,0 +1,67 @@
+import asyncio
+
+class CircuitEditBatcher:
+    """Merge the Circuit.edit params of one circuit arriving within a short window, sending one edit per param."""
+
+    def __init__(self, loop, send, window_ms: int = 100):
+        """
+        Parameters:
+            loop: Event loop used to schedule the flush
+            send: Coroutine function sending a command and returning the cube's response
+            window_ms: Debounce window in milliseconds, counted from the first edit of a batch
+        """
+        self._loop      = loop
+        self._send      = send
+        self._window    = max(window_ms, 0) / 1000
+        self._batches   = {}
+        # Flushed batches by the task sending them, cancelled with the batcher
+        self._sending   = {}
+
+    async def edit(self, circuit_id: str, params: dict) -> dict:
+        """Add params to the pending edit of the circuit and return the merged params once the cube accepted them."""
+        batch = self._batches.get(circuit_id)
+        if batch is None:
+            batch = self._batches[circuit_id] = _EditBatch(self._loop.create_future())
+            batch.handle = self._loop.call_later(self._window, self._flush, circuit_id)
+        # The last value per param wins, so the cube always ends up in the final state
+        batch.params.update(params)
+        # Shielded, one caller giving up must not cancel the edit for the others
+        return await asyncio.shield(batch.future)
+
+    def _flush(self, circuit_id: str):
+        batch = self._batches.pop(circuit_id, None)
+        if batch is not None:
+            task = self._loop.create_task(self._async_send(circuit_id, batch))
+            self._sending[task] = batch
+            task.add_done_callback(self._sending.pop)
+
+    async def _async_send(self, circuit_id: str, batch):
+        params = dict(batch.params)
+        # One edit per param in the format the integration always sent, the cube expects a single state_type per edit
+        try:
+            await asyncio.gather(*(
+                self._send({"method": "Circuit.edit", "params": {"circuitId": circuit_id, key: value, "state_type": key}})
+                for key, value in params.items()
+            ))
+        except Exception as e:
+            batch.future.set_exception(e)
+        else:
+            batch.future.set_result(params)
+
+    def cancel(self):
+        """Drop pending edits and stop sending flushed ones, their callers get a CancelledError."""
+        for batch in self._batches.values():
+            batch.handle.cancel()
+            batch.future.cancel()
+        self._batches.clear()
+        for task, batch in list(self._sending.items()):
+            task.cancel()
+            batch.future.cancel()
+
+class _EditBatch:
+    __slots__ = ("future", "params", "handle")
+
+    def __init__(self, future):
+        self.future     = future
+        self.params     = {}
+        self.handle     = None
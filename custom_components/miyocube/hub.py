@@ -0,0 +1,420 @@
+import asyncio
+import datetime
+import logging
+import time
+from homeassistant.core import HomeAssistant
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.exceptions import ConfigEntryNotReady
+from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers.device_registry import DeviceInfo
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.storage import Store
+from .const import (
+    DOMAIN,
+    CONF_COALESCE_WINDOW, DEFAULT_COALESCE_WINDOW,
+    CONF_TRACE_SIZE, DEFAULT_TRACE_SIZE,
+    CONF_TRACE_SAMPLE_RATE, DEFAULT_TRACE_SAMPLE_RATE,
+    CONF_QUEUE_SIZE, DEFAULT_QUEUE_SIZE,
+    CONF_OVERFLOW_POLICY, DEFAULT_OVERFLOW_POLICY,
+    CONF_PING_INTERVAL, DEFAULT_PING_INTERVAL,
+    CONF_PONG_TIMEOUT, DEFAULT_PONG_TIMEOUT,
+    CONF_AGGREGATE_WINDOWS, DEFAULT_AGGREGATE_WINDOWS,
+)
+from .ws_client import WSClient
+from .dispatcher import MiyoDispatcher, UpdateCoalescer
+from .edit_batcher import CircuitEditBatcher
+from .scheduler import IrrigationScheduler
+from .circuit import MiyoCircuit
+from .state_store import MiyoStateStore
+from .state_filter import StateFilter
+from .message_trace import MessageTrace
+from .metrics import LinkMetrics
+from .aggregates import RollingAggregates, parse_windows
+from .api import MiyoApiClient, MiyoApiError
+from .utils import parse_ws_payload, parse_circuit, is_full_circuit, circuit_updates, topology_changes, topology_ids, camel_to_snake, convert_statetype_value
+
+_LOGGER = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+# Seconds between writes of the persisted snapshot while updates arrive
+SNAPSHOT_SAVE_DELAY = 300
+# Retry delays in seconds while the cube does not answer after a warm start
+REFRESH_RETRY_DELAY = 15
+REFRESH_RETRY_MAX_DELAY = 300
+# Circuits, sensors or valves may also change without a notification we understand
+TOPOLOGY_REFRESH_INTERVAL = datetime.timedelta(minutes=15)
+# Seconds to wait before fetching the topology after an update for an unknown id, a burst of them triggers one fetch
+TOPOLOGY_REFRESH_DELAY = 2
+# Milliseconds within which switch changes of one circuit are merged into one Circuit.edit
+EDIT_DEBOUNCE_WINDOW = 100
+
+class MiyoHub:
+    """Connection hub of one MIYO Cube config entry, owning its clients, topology and dispatcher."""
+
+    def __init__(self, hass: HomeAssistant, entry: ConfigEntry):
+        self.hass           = hass
+        self.entry          = entry
+        self.host           = entry.data.get("host")
+        self.cube_id        = entry.data.get("cube_uuid")
+        # Current topology as parsed from the HTTP API, also persisted in the snapshot
+        self.circuits       = None
+        self._topology_ids  = set()
+        # Unknown ids that already triggered a topology fetch, e.g. sensors not assigned to a circuit
+        self._unknown_ids   = set()
+        self.loaded         = False
+        self._device_infos  = {}
+        # Updates received while the topology is still loading, replayed on top of it
+        self._early_updates = []
+        # True while the entities show values restored from the snapshot instead of the cube
+        self.stale          = False
+        self.signal_available = f"{DOMAIN}_{entry.entry_id}_available"
+        self._snapshot      = _snapshot_store(hass, entry)
+        self._save_scheduled = False
+        self._refresh_task  = None
+        # (create_entities, async_add_entities) of every platform and the unique ids added through them
+        self._platforms     = []
+        self._unique_ids    = set()
+        # circuit_id -> MiyoCircuit holding the runtime state shared by the entities of a circuit
+        self.runtime        = {}
+        self._topology_handle = None
+        self._unsub_interval = None
+
+        api_key = entry.data.get("api_key")
+        self.api            = MiyoApiClient(async_get_clientsession(hass), self.host, api_key)
+        self.store          = MiyoStateStore()
+        self.dispatcher     = MiyoDispatcher(self.store)
+        # Deadbands of the noisy sensor values, applied by the sensor entities before writing their state
+        self.state_filter   = StateFilter.from_options(entry.options)
+        # Rolling min, max, mean and rate per soil sensor value, fed from every dispatched update
+        self.aggregate_windows = parse_windows(entry.options.get(CONF_AGGREGATE_WINDOWS, DEFAULT_AGGREGATE_WINDOWS))
+        self.aggregates     = RollingAggregates(self.dispatcher.subscribe)
+
+        # Bursts of notifications are merged into one batch per coalescing window
+        coalesce_window = entry.options.get(CONF_COALESCE_WINDOW, DEFAULT_COALESCE_WINDOW)
+        self.coalescer      = UpdateCoalescer(hass.loop, self._dispatch, coalesce_window)
+        self.metrics        = LinkMetrics()
+
+        # Opt-in ring buffer of raw messages for the diagnostics download
+        self.trace          = MessageTrace(
+            entry.options.get(CONF_TRACE_SIZE, DEFAULT_TRACE_SIZE),
+            entry.options.get(CONF_TRACE_SAMPLE_RATE, DEFAULT_TRACE_SAMPLE_RATE),
+        )
+
+        self.ws_client      = WSClient(
+            url=f"ws://{self.host}:3810",
+            on_message=self._async_handle_ws_message,
+            api_key=api_key,
+            ping_interval=entry.options.get(CONF_PING_INTERVAL, DEFAULT_PING_INTERVAL),
+            pong_timeout=entry.options.get(CONF_PONG_TIMEOUT, DEFAULT_PONG_TIMEOUT),
+            on_connect=self._async_resync,
+            metrics=self.metrics,
+            queue_size=entry.options.get(CONF_QUEUE_SIZE, DEFAULT_QUEUE_SIZE),
+            overflow_policy=entry.options.get(CONF_OVERFLOW_POLICY, DEFAULT_OVERFLOW_POLICY),
+            trace=self.trace,
+        )
+        self.edits          = CircuitEditBatcher(hass.loop, self.ws_client.send, EDIT_DEBOUNCE_WINDOW)
+        self.scheduler      = IrrigationScheduler(
+            start=lambda circuit_id, duration: self.async_irrigation(circuit_id, "start", duration),
+            stop=lambda circuit_id: self.async_irrigation(circuit_id, "stop"),
+            subscribe=self.dispatcher.subscribe,
+            create_task=lambda coro, circuit_id: entry.async_create_background_task(hass, coro, f"{DOMAIN} irrigation {circuit_id}"),
+        )
+
+    async def async_setup(self):
+        """Connect to the cube and load its topology, from the snapshot of the last run if the cube does not answer."""
+        _LOGGER.info("MIYO Cube wrapper started for device at %s", self.host)
+        # Connects in the background while the topology loads
+        await self.ws_client.start()
+        snapshot = await self._snapshot.async_load()
+
+        if snapshot:
+            # Warm start, entities are created right away and refreshed once the cube answers
+            self.cube_id = snapshot["cube_id"]
+            self.circuits = snapshot["circuits"]
+            self._topology_ids = topology_ids(self.circuits)
+            self.dispatcher.seed(circuit_updates(self.circuits))
+            self.dispatcher.seed(_restore_updates(snapshot.get("state", {})))
+            self.aggregates.restore(snapshot.get("aggregates"))
+            self.stale = True
+            self.loaded = True
+            self._replay_early_updates()
+            self._refresh_task = self.entry.async_create_background_task(self.hass, self._async_refresh_until_fresh(), f"{DOMAIN} refresh {self.host}")
+            self._start_topology_interval()
+            return
+
+        try:
+            cube, circuits = await self._async_fetch()
+        except MiyoApiError as e:
+            await self.ws_client.stop()
+            raise ConfigEntryNotReady(f"Failed to connect to MIYO Cube at {self.host}: {e}") from e
+
+        self.circuits = circuits
+        self._topology_ids = topology_ids(circuits)
+        self.dispatcher.seed(circuit_updates(circuits))
+        self.loaded = True
+        self._replay_early_updates()
+        self._schedule_save(0)
+        self._start_topology_interval()
+
+    async def _async_fetch(self):
+        """Query status and circuits concurrently and adopt the cube's uuid."""
+        cube, circuits = await asyncio.gather(self.api.async_get_status(), self.api.async_get_circuits())
+        if "uuid" not in cube:
+            raise MiyoApiError("No 'uuid' in cube status response")
+
+        self.cube_id = cube["uuid"]
+        if self.entry.data.get("cube_uuid") != self.cube_id:
+            self.hass.config_entries.async_update_entry(self.entry, data={**self.entry.data, "cube_uuid": self.cube_id})
+        return cube, circuits
+
+    def _replay_early_updates(self):
+        if self._early_updates:
+            _LOGGER.debug("Replaying %s updates received from %s during setup", len(self._early_updates), self.host)
+            self.dispatcher.dispatch(self._early_updates)
+            self._early_updates = []
+
+    def circuit(self, circuit_id: str) -> MiyoCircuit:
+        """Return the runtime object of a circuit, created on first use."""
+        circuit = self.runtime.get(circuit_id)
+        if circuit is None:
+            circuit = self.runtime[circuit_id] = MiyoCircuit(circuit_id)
+        return circuit
+
+    def device_info(self, device_id: str, device_type: str, device_name: str, circuit_id: str) -> DeviceInfo:
+        """Return the DeviceInfo of a device, built once and shared by all of its entities."""
+        device_info = self._device_infos.get(device_id)
+        if device_info is None:
+            device_info = DeviceInfo(
+                identifiers={(DOMAIN, device_id)},
+                translation_key=camel_to_snake(device_type),
+                translation_placeholders={"id": device_name},
+                manufacturer="MIYO",
+                model="Smart Irrigation",
+            )
+            if device_type not in ("circuit", "cube"):
+                device_info["via_device"] = (DOMAIN, circuit_id)
+            self._device_infos[device_id] = device_info
+        return device_info
+
+    async def async_irrigation(self, circuit_id: str, mode: str, duration: int = None):
+        """Start or stop irrigation of a circuit, a stop goes out first and replaces a start still waiting for the connection."""
+        params = {"circuitId": circuit_id, "mode": mode}
+        if duration is not None:
+            params["duration"] = duration
+        # A start is never sent twice, it would restart the irrigation
+        stop = mode == "stop"
+        await self.ws_client.send({"method": "Circuit.irrigation", "params": params}, priority=stop, idempotent=stop)
+
+    @property
+    def available(self) -> bool:
+        """False while the entities only show values restored from the snapshot."""
+        return not self.stale
+
+    async def async_unload(self):
+        """Disconnect from the cube."""
+        if self._refresh_task:
+            self._refresh_task.cancel()
+        if self._unsub_interval:
+            self._unsub_interval()
+        if self._topology_handle:
+            self._topology_handle.cancel()
+        self.edits.cancel()
+        self.scheduler.cancel()
+        self.aggregates.cancel()
+        await self.ws_client.stop()
+        # Pending updates still go into the snapshot, nothing may be dispatched after the unload
+        self.coalescer.flush()
+        self.coalescer.cancel()
+        if self.loaded:
+            # Written now instead of by the delayed save, the reloaded hub loads it right away
+            # and a pending timer of this hub must not overwrite the newer data later
+            await self._snapshot.async_save(self._snapshot_data())
+
+    async def _async_handle_ws_message(self, msg):
+        """Receive ws messages and dispatch updates to entities."""
+        _LOGGER.debug("Received WS message from %s: %s", self.host, msg)
+        started = time.perf_counter()
+        payload = parse_ws_payload(msg)
+        self.metrics.parse_time.add((time.perf_counter() - started) * 1000)
+        if not self.loaded:
+            self._early_updates.extend(payload)
+            return
+        self.coalescer.add(payload)
+
+        notification = msg.get("notification")
+        if notification == "Circuit.edited":
+            circuit = msg.get("params", {}).get("circuit", {})
+            if is_full_circuit(circuit):
+                self._apply_circuit(parse_circuit(circuit.get("id"), circuit))
+
+        # The cube has no notification for added circuits or devices, they show up as updates for an unknown id
+        unknown = {update["device_id"] for update in payload} - self._topology_ids - self._unknown_ids
+        if unknown:
+            self._unknown_ids |= unknown
+            self._schedule_topology_refresh()
+
+    def _dispatch(self, updates):
+        """Dispatch a batch of updates to the entities, timing how long it blocks the loop."""
+        started = time.perf_counter()
+        self.dispatcher.dispatch(updates)
+        self.metrics.dispatch_time.add((time.perf_counter() - started) * 1000)
+        self._schedule_save()
+
+    async def _async_resync(self):
+        """Fetch the circuits after a reconnect and dispatch only the values that changed while offline."""
+        if not self.loaded:
+            # Initial connect, setup loads the topology itself
+            return
+        try:
+            await self._async_refresh()
+        except MiyoApiError as e:
+            _LOGGER.warning("State resync after reconnect to %s failed: %s", self.host, e)
+
+    async def _async_refresh(self):
+        """Load the current topology from the cube and bring the store up to date."""
+        if self.stale:
+            _, circuits = await self._async_fetch()
+        else:
+            circuits = await self.api.async_get_circuits()
+
+        self.coalescer.flush()
+        changed = self.dispatcher.diff(circuit_updates(circuits))
+        _LOGGER.debug("Resync with %s dispatches %s changed values", self.host, len(changed))
+        self.dispatcher.dispatch(changed)
+        self._apply_topology(circuits)
+        self._schedule_save(0)
+
+        if self.stale:
+            self.stale = False
+            async_dispatcher_send(self.hass, self.signal_available)
+
+    async def _async_refresh_until_fresh(self):
+        """Retry the refresh after a warm start until the cube answers."""
+        delay = REFRESH_RETRY_DELAY
+        while self.stale:
+            try:
+                await self._async_refresh()
+                return
+            except MiyoApiError as e:
+                _LOGGER.warning("MIYO Cube at %s not reachable, showing the snapshot for now, retrying in %ss: %s", self.host, delay, e)
+            except Exception:
+                # Only this task clears stale, it must not die and leave the entities unavailable
+                _LOGGER.exception("Unexpected error refreshing from MIYO Cube at %s, retrying in %ss", self.host, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, REFRESH_RETRY_MAX_DELAY)
+
+    #
+    #  ---------- Topology ----------
+    #
+
+    def register_platform(self, create_entities, async_add_entities):
+        """Add the entities of all known circuits and remember the platform for circuits or devices added later.
+
+        Parameters:
+            create_entities: Called with the hub and one circuit, returns the entities of that circuit and its devices
+            async_add_entities: Callback of the platform's async_setup_entry
+        """
+        self._platforms.append((create_entities, async_add_entities))
+        self._add_entities(create_entities, async_add_entities, self.circuits)
+
+    def _add_entities(self, create_entities, async_add_entities, circuits):
+        """Add only the entities whose unique id is not known yet."""
+        entities = [
+            entity for circuit in circuits
+            for entity in create_entities(self, circuit)
+            if entity.unique_id not in self._unique_ids
+        ]
+        if entities:
+            self._unique_ids.update(entity.unique_id for entity in entities)
+            async_add_entities(entities)
+
+    def _apply_topology(self, circuits):
+        """Add entities for new circuits and devices and remove the devices that disappeared."""
+        changed, removed = topology_changes(self.circuits, circuits)
+        self.circuits = circuits
+        self._topology_ids = topology_ids(circuits)
+        if changed:
+            for create_entities, async_add_entities in self._platforms:
+                self._add_entities(create_entities, async_add_entities, changed)
+        if removed:
+            self._remove_devices(removed)
+
+    def _apply_circuit(self, circuit):
+        """Apply the full circuit of a Circuit.edited notification."""
+        circuits = [known for known in self.circuits if known["id"] != circuit["id"]]
+        circuits.append(circuit)
+        self._apply_topology(circuits)
+
+    def _remove_devices(self, device_ids):
+        """Remove devices together with their entities and state."""
+        device_registry = dr.async_get(self.hass)
+        for device_id in device_ids:
+            _LOGGER.info("Device %s was removed from MIYO Cube at %s", device_id, self.host)
+            device = device_registry.async_get_device(identifiers={(DOMAIN, device_id)})
+            if device is not None:
+                device_registry.async_update_device(device.id, remove_config_entry_id=self.entry.entry_id)
+            self._device_infos.pop(device_id, None)
+            self.runtime.pop(device_id, None)
+            self.aggregates.discard(device_id)
+            self.store.discard(device_id)
+            prefix = f"{device_id}_"
+            self._unique_ids = {unique_id for unique_id in self._unique_ids if not unique_id.startswith(prefix)}
+
+    def _schedule_topology_refresh(self):
+        if self._topology_handle is None:
+            self._topology_handle = self.hass.loop.call_later(TOPOLOGY_REFRESH_DELAY, self._start_topology_refresh)
+
+    def _start_topology_refresh(self):
+        self._topology_handle = None
+        self.entry.async_create_background_task(self.hass, self._async_refresh_topology(), f"{DOMAIN} topology {self.host}")
+
+    def _start_topology_interval(self):
+        self._unsub_interval = async_track_time_interval(self.hass, self._async_refresh_topology, TOPOLOGY_REFRESH_INTERVAL)
+
+    async def _async_refresh_topology(self, now=None):
+        """Fetch the circuits and apply added or removed devices, skipped while the warm start refresh is pending."""
+        if self.stale:
+            return
+        try:
+            await self._async_refresh()
+        except MiyoApiError as e:
+            _LOGGER.warning("Topology refresh from %s failed: %s", self.host, e)
+
+    #
+    #  ---------- Snapshot ----------
+    #
+
+    def _schedule_save(self, delay=SNAPSHOT_SAVE_DELAY):
+        """Persist topology and state after delay seconds, the Store also writes pending data when HA stops."""
+        if self._save_scheduled and delay:
+            return
+        self._save_scheduled = True
+        self._snapshot.async_delay_save(self._snapshot_data, delay)
+
+    def _snapshot_data(self) -> dict:
+        self._save_scheduled = False
+        state = {
+            device_id: {state_type: _serialize(value) for state_type, value in values.items()}
+            for device_id, values in self.store.snapshot().items()
+        }
+        return {"cube_id": self.cube_id, "circuits": self.circuits, "state": state, "aggregates": self.aggregates.snapshot()}
+
+def _snapshot_store(hass: HomeAssistant, entry: ConfigEntry) -> Store:
+    return Store(hass, SNAPSHOT_VERSION, f"{DOMAIN}.{entry.entry_id}")
+
+async def async_remove_snapshot(hass: HomeAssistant, entry: ConfigEntry):
+    """Delete the persisted snapshot of a removed config entry."""
+    await _snapshot_store(hass, entry).async_remove()
+
+def _serialize(value):
+    return value.timestamp() if isinstance(value, datetime.datetime) else value
+
+def _restore_updates(state: dict) -> list:
+    """Turn the persisted state back into updates, converting values like a notification would."""
+    return [
+        {"device_id": device_id, "state_type": state_type, "value": convert_statetype_value(state_type, value)}
+        for device_id, values in state.items()
+        for state_type, value in values.items()
+    ]
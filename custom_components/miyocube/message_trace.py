@@ -0,0 +1,46 @@
+import collections
+import datetime
+import time
+
+class MessageTrace:
+    """Bounded ring buffer keeping the last raw WS messages, sampled at a fixed rate."""
+
+    def __init__(self, size: int = 0, sample_rate: float = 1.0):
+        """
+        Parameters:
+            size: Number of messages to keep, 0 disables tracing
+            sample_rate: Fraction of messages to record, between 0 and 1
+        """
+        self._buffer        = collections.deque(maxlen=size) if size > 0 else None
+        self._sample_rate   = min(max(sample_rate, 0.0), 1.0)
+        self._credit        = 0.0
+        self.seen           = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._buffer is not None
+
+    def record(self, msg):
+        """Keep the raw frame msg if it falls into the sample, evicting the oldest entry when full."""
+        if self._buffer is None:
+            return
+        self.seen += 1
+        # Deterministic sampling, every 1/sample_rate-th message is kept
+        self._credit += self._sample_rate
+        if self._credit < 1.0:
+            return
+        self._credit -= 1.0
+        self._buffer.append((time.time(), msg))
+
+    def as_list(self) -> list:
+        """Return the recorded messages, oldest first, for the diagnostics download."""
+        if self._buffer is None:
+            return []
+        return [
+            {"time": datetime.datetime.fromtimestamp(ts, tz=datetime.timezone.utc).isoformat(), "message": _text(msg)}
+            for ts, msg in self._buffer
+        ]
+
+def _text(msg) -> str:
+    # Binary frames are kept as received, the diagnostics download needs text
+    return msg.decode("utf-8", "replace") if isinstance(msg, (bytes, bytearray)) else msg
@@ -0,0 +1,116 @@
+import time
+
+class RollingRate:
+    """Events per second over a sliding window of one-second buckets, O(1) per event."""
+
+    def __init__(self, window: int = 60):
+        self._window    = window
+        self._buckets   = [0] * window
+        self._second    = int(time.monotonic())
+
+    def _advance(self, now: int):
+        elapsed = now - self._second
+        if elapsed <= 0:
+            return
+        for i in range(1, min(elapsed, self._window) + 1):
+            self._buckets[(self._second + i) % self._window] = 0
+        self._second = now
+
+    def add(self, count: int = 1):
+        now = int(time.monotonic())
+        self._advance(now)
+        self._buckets[now % self._window] += count
+
+    @property
+    def rate(self) -> float:
+        self._advance(int(time.monotonic()))
+        return sum(self._buckets) / self._window
+
+class RollingAverage:
+    """Exponentially weighted moving average plus the maximum, O(1) per sample."""
+
+    def __init__(self, alpha: float = 0.05):
+        self._alpha     = alpha
+        self.average    = None
+        self.last       = None
+        self.maximum    = None
+        self.count      = 0
+
+    def add(self, value: float):
+        self.count += 1
+        self.last = value
+        self.average = value if self.average is None else self.average + self._alpha * (value - self.average)
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def as_dict(self) -> dict:
+        return {"average": self.average, "last": self.last, "max": self.maximum, "count": self.count}
+
+class LinkMetrics:
+    """Cheap rolling counters describing the load and health of one cube connection."""
+
+    def __init__(self):
+        self.messages           = 0
+        self.malformed_frames   = 0
+        self.dropped_frames     = 0
+        self.coalesced_frames   = 0
+        self.queue_depth        = 0
+        self.queue_high_water   = 0
+        self.command_queue_depth = 0
+        self.commands_expired   = 0
+        self.commands_retried   = 0
+        self.reconnects         = 0
+        self.missed_pongs       = 0
+        self.connected_since    = None
+        self.message_rate       = RollingRate()
+        # Durations in milliseconds
+        self.parse_time         = RollingAverage()
+        self.dispatch_time      = RollingAverage()
+        self.command_rtt        = RollingAverage(alpha=0.2)
+        self.ping_rtt           = RollingAverage(alpha=0.2)
+
+    def message_received(self):
+        self.messages += 1
+        self.message_rate.add()
+
+    def queue_added(self, depth: int):
+        self.queue_depth = depth
+        if depth > self.queue_high_water:
+            self.queue_high_water = depth
+
+    def connected(self):
+        if self.connected_since is not None:
+            return
+        self.connected_since = time.time()
+
+    def disconnected(self):
+        if self.connected_since is not None:
+            self.reconnects += 1
+        self.connected_since = None
+
+    @property
+    def uptime(self):
+        """Seconds the current connection has been up, None while disconnected."""
+        return None if self.connected_since is None else time.time() - self.connected_since
+
+    def as_dict(self) -> dict:
+        return {
+            "messages": self.messages,
+            "messages_per_second": self.message_rate.rate,
+            "malformed_frames": self.malformed_frames,
+            "dropped_frames": self.dropped_frames,
+            "coalesced_frames": self.coalesced_frames,
+            "queue_depth": self.queue_depth,
+            "queue_high_water": self.queue_high_water,
+            "command_queue_depth": self.command_queue_depth,
+            "commands_expired": self.commands_expired,
+            "commands_retried": self.commands_retried,
+            "reconnects": self.reconnects,
+            "missed_pongs": self.missed_pongs,
+            "connected_since": self.connected_since,
+            "uptime": self.uptime,
+            "parse_time_ms": self.parse_time.as_dict(),
+            "dispatch_time_ms": self.dispatch_time.as_dict(),
+            "command_rtt_ms": self.command_rtt.as_dict(),
+            "ping_rtt_ms": self.ping_rtt.as_dict(),
+        }
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from homeassistant.components.number import NumberEntity
+from homeassistant.components.number import NumberEntityDescription, RestoreNumber
 from homeassistant.core import callback
 from homeassistant.const import UnitOfTime
 from .const import DOMAIN
@@ -9,31 +9,42 @@ import datetime
 
 _LOGGER = logging.getLogger(__name__)
 
+# Static description per state type, resolved once when the entity is created
+NUMBER_DESCRIPTIONS = {
+    description.key: description for description in (
+        NumberEntityDescription(key="duration", translation_key="duration", icon="mdi:timelapse", native_min_value=1, native_max_value=60, native_step=1, native_unit_of_measurement=UnitOfTime.MINUTES),
+    )
+}
+
 async def async_setup_entry(hass, entry, async_add_entities):
-    """Set up the sensor entity from config entry."""    
+    """Set up the number entities from config entry."""
+    hub = hass.data[DOMAIN][entry.entry_id]
+    # Adds the entities of the known circuits now and of circuits or devices appearing later
+    hub.register_platform(_circuit_entities, async_add_entities)
 
-    circuits_data = hass.data[DOMAIN][entry.entry_id]
+def _circuit_entities(hub, circuit) -> list:
+    """Create the number entities of one circuit and its devices."""
     entities = []
-    cube_id = entry.data.get('cube_uuid')
+    cube_id = hub.cube_id
 
-    for circuit in circuits_data:
-        
-        circuit_id      = circuit["id"]
-        circuit_name    = f"{circuit["name"]}"
+    circuit_id      = circuit["id"]
+    circuit_name    = f"{circuit["name"]}"
 
-        entities.append(MiyoSlider(hass, cube_id, circuit_id, circuit_id, "circuit", circuit_name, "duration", 1))
+    entities.append(MiyoSlider(hub, cube_id, circuit_id, circuit_id, "circuit", circuit_name, "duration", 1))
 
-    async_add_entities(entities)
+    return entities
 
     
 
-class MiyoSlider(NumberEntity):
-    """Slider receiving updates via WS."""
+class MiyoSlider(RestoreNumber):
+    """Slider holding the manual irrigation duration of a circuit, restored across restarts."""
+
+    _attr_should_poll = False
 
-    def __init__(self, hass, cube_id: str, circuit_id: str, device_id: str, device_type: str, device_name: str, state: str, init_value = None):
+    def __init__(self, hub, cube_id: str, circuit_id: str, device_id: str, device_type: str, device_name: str, state: str, init_value = None):
         """
         Parameters:
-            hass: HomeAssistant core object
+            hub: MiyoHub of the config entry
             cube_id: ID of the Miyo cube
             circuit_id: ID of the circuit
             device_id: ID of the sensor device
@@ -41,71 +52,37 @@ class MiyoSlider(NumberEntity):
             deviceName: Name of the device
             state: Type of state this sensor represents (e.g., "moisture", "temperature")            
         """
-        self.hass = hass
+        self.hass = hub.hass
+        self._hub = hub
         self._device_id         = device_id
         self._statetype         = state
         self._device_name       = device_name
         self._device_type       = device_type
-        self._state             = None
         self._circuit_id        = circuit_id
 
         self._attr_unique_id    = f"{device_id}_{state}"
         self._attr_has_entity_name = True
-        self._attr_translation_key = camel_to_snake(state)
-        
-        self._attr_native_min_value = 1
-        self._attr_native_max_value = 60
-        self._attr_native_step = 1
+        self._attr_device_info  = hub.device_info(device_id, device_type, device_name, circuit_id)
+        self._circuit           = hub.circuit(circuit_id)
+        self.entity_description = NUMBER_DESCRIPTIONS.get(state) or NumberEntityDescription(key=state, translation_key=camel_to_snake(state), icon="mdi:sensor")
 
-        if init_value is not None: 
-            self._state = convert_statetype_value(self._statetype, init_value)
+        if init_value is not None and self._circuit.duration is None:
+            self._circuit.duration = convert_statetype_value(self._statetype, init_value)
 
     #
     #  ---------- HA Entity Properties ----------
     #
-    @property
-    def native_unit_of_measurement(self):        
-        if self._statetype == "duration":
-            return UnitOfTime.MINUTES
-        return None
-
-    @property
-    def is_on(self):
-        """Return true if switch is on."""
-        return self._state is True
-
     @property
     def native_value(self):
-        return self._state
+        return self._circuit.duration
 
-    @property
-    def device_class(self):
-        return "switch"
-
-    @property
-    def icon(self):
-        if self._statetype == "duration":
-            return "mdi:timelapse"
-        else:
-            return "mdi:sensor"
-
-    @property
-    def device_info(self):
-        """Associate this entity with a HA device."""
-        device_info = {
-            "identifiers": {(DOMAIN, self._device_id)},
-            "translation_key": camel_to_snake(self._device_type),
-            "translation_placeholders": {"id": self._device_name},
-            "manufacturer": "MIYO",
-            "model": "Smart Irrigation"
-        }
-
-        if self._device_type != "circuit":
-            device_info["via_device"] = (DOMAIN, self._circuit_id)
-        
-        return device_info
+    async def async_added_to_hass(self):
+        """Restore the duration set before the last restart."""
+        last = await self.async_get_last_number_data()
+        if last is not None and last.native_value is not None:
+            self._circuit.duration = convert_statetype_value(self._statetype, last.native_value)
 
     async def async_set_native_value(self, value: float) -> None:
         """Handle slider value change from the UI."""
-        self._state = value
-        self.async_write_ha_state()
\ No newline at end of file
+        self._circuit.duration = convert_statetype_value(self._statetype, value)
+        self.async_write_ha_state()
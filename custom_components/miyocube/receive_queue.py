@@ -0,0 +1,90 @@
+import asyncio
+import itertools
+
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_COALESCE = "coalesce"
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_COALESCE)
+
+class ReceiveQueue:
+    """Bounded FIFO of decoded notifications between the socket reader and the dispatcher task.
+
+    Only telemetry, i.e. messages with a key, may be coalesced or dropped, and only
+    once the queue is full. Other messages are always kept, even if that takes the
+    queue above its size.
+    """
+
+    def __init__(self, maxsize: int = 1000, policy: str = OVERFLOW_COALESCE, key_fn=None, metrics=None):
+        """
+        Parameters:
+            maxsize: Number of queued messages before the overflow policy applies
+            policy: OVERFLOW_COALESCE replaces the newest queued message with the same key, OVERFLOW_DROP_OLDEST only drops
+            key_fn: Returns the coalescing key of a telemetry message, None for messages that must not be dropped
+            metrics: Optional LinkMetrics receiving depth and drop counters
+        """
+        self._maxsize   = maxsize
+        self._coalesce  = policy == OVERFLOW_COALESCE
+        self._key_fn    = key_fn or (lambda data: None)
+        self._metrics   = metrics
+        # Insertion ordered, (sequence, key) -> message; unkeyed messages get a unique int key
+        self._items     = {}
+        # Telemetry key -> item key of its newest queued message
+        self._latest    = {}
+        self._sequence  = itertools.count()
+        self._event     = asyncio.Event()
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, data):
+        """Queue a message without ever blocking the reader."""
+        key = self._key_fn(data)
+        full = len(self._items) >= self._maxsize
+        if key is None:
+            item = next(self._sequence)
+        else:
+            if full and self._coalesce and key in self._latest:
+                # Keep the position of the older message, only the newest value matters
+                self._items[self._latest[key]] = data
+                if self._metrics:
+                    self._metrics.coalesced_frames += 1
+                return
+            item = self._latest[key] = (next(self._sequence), key)
+
+        if full:
+            self._drop_oldest_telemetry()
+        self._items[item] = data
+        self._event.set()
+        if self._metrics:
+            self._metrics.queue_added(len(self._items))
+
+    def _drop_oldest_telemetry(self):
+        for item in self._items:
+            if not isinstance(item, int):
+                del self._items[item]
+                self._forget(item)
+                if self._metrics:
+                    self._metrics.dropped_frames += 1
+                return
+
+    async def get(self):
+        """Wait for and return the oldest message."""
+        while not self._items:
+            self._event.clear()
+            await self._event.wait()
+        item = next(iter(self._items))
+        data = self._items.pop(item)
+        if not isinstance(item, int):
+            self._forget(item)
+        if self._metrics:
+            self._metrics.queue_depth = len(self._items)
+        return data
+
+    def _forget(self, item):
+        if self._latest.get(item[1]) == item:
+            del self._latest[item[1]]
+
+    def clear(self):
+        self._items.clear()
+        self._latest.clear()
+        if self._metrics:
+            self._metrics.queue_depth = 0
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+from collections import deque
+
+_LOGGER = logging.getLogger(__name__)
+
+# Extra seconds to wait for the cube to report the end of an irrigation
+END_GRACE = 60
+
+class IrrigationScheduler:
+    """Runs a plan of circuits one after another, with at most max_concurrent of them irrigating at once."""
+
+    def __init__(self, start, stop, subscribe, create_task):
+        """
+        Parameters:
+            start: Coroutine function starting irrigation of a circuit for a duration in minutes
+            stop: Coroutine function stopping irrigation of a circuit
+            subscribe: MiyoDispatcher.subscribe, to learn when the cube ends an irrigation
+            create_task: Creates the task running one circuit
+        """
+        self._start             = start
+        self._stop              = stop
+        self._subscribe         = subscribe
+        self._create_task       = create_task
+        self._pending           = deque()
+        self._running           = {}
+        self._max_concurrent    = 1
+
+    @property
+    def state(self) -> dict:
+        return {
+            "running": list(self._running),
+            "pending": [circuit_id for circuit_id, _ in self._pending],
+            "max_concurrent": self._max_concurrent,
+        }
+
+    def start_plan(self, plan: list, max_concurrent: int = 1):
+        """Replace the pending part of the current plan, circuits already irrigating run to their end before they run again.
+
+        Parameters:
+            plan: (circuit_id, duration in minutes) in the order they should run
+            max_concurrent: Number of circuits allowed to irrigate at the same time
+        """
+        self._pending = deque(plan)
+        self._max_concurrent = max_concurrent
+        self._fill()
+
+    def _fill(self):
+        """Start pending circuits until the limit is reached."""
+        deferred = []
+        while self._pending and len(self._running) < self._max_concurrent:
+            circuit_id, duration = self._pending.popleft()
+            if circuit_id in self._running:
+                # Still irrigating, runs again after its current irrigation ended
+                deferred.append((circuit_id, duration))
+                continue
+            self._running[circuit_id] = self._create_task(self._async_irrigate(circuit_id, duration), circuit_id)
+        self._pending.extendleft(reversed(deferred))
+
+    async def _async_irrigate(self, circuit_id: str, duration: int):
+        ended = asyncio.Event()
+
+        def irrigation_changed(value):
+            if value is False:
+                ended.set()
+
+        unsubscribe = self._subscribe(circuit_id, "irrigationWasStarted", irrigation_changed)
+        try:
+            await self._start(circuit_id, duration)
+            try:
+                await asyncio.wait_for(ended.wait(), duration * 60 + END_GRACE)
+            except asyncio.TimeoutError:
+                _LOGGER.debug("No end of irrigation reported for circuit %s, continuing the plan", circuit_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _LOGGER.error("Could not start irrigation of circuit %s, continuing the plan: %s", circuit_id, e)
+        finally:
+            unsubscribe()
+            self._running.pop(circuit_id, None)
+            self._fill()
+
+    async def async_stop(self, circuit_ids=None):
+        """Stop the given circuits, or the whole plan if None, and remove them from the plan."""
+        if circuit_ids is None:
+            self._pending.clear()
+            circuit_ids = list(self._running)
+        else:
+            circuit_ids = set(circuit_ids)
+            self._pending = deque(item for item in self._pending if item[0] not in circuit_ids)
+
+        for circuit_id in circuit_ids:
+            task = self._running.get(circuit_id)
+            if task is not None:
+                task.cancel()
+        results = await asyncio.gather(*(self._stop(circuit_id) for circuit_id in circuit_ids), return_exceptions=True)
+        for circuit_id, result in zip(circuit_ids, results):
+            if isinstance(result, Exception):
+                _LOGGER.error("Could not stop irrigation of circuit %s: %s", circuit_id, result)
+
+    def cancel(self):
+        """Forget the plan without stopping anything, e.g. on unload, the cube ends running irrigations itself."""
+        self._pending.clear()
+        for task in self._running.values():
+            task.cancel()
@@ -1,63 +1,131 @@
 from __future__ import annotations
-from homeassistant.components.sensor import SensorEntity
-from homeassistant.const import PERCENTAGE, UnitOfTemperature, UnitOfElectricPotential, LIGHT_LUX
+from collections.abc import Callable
+from dataclasses import dataclass, replace
+from homeassistant.components.sensor import SensorEntity, SensorEntityDescription, SensorDeviceClass, SensorStateClass
+from homeassistant.const import PERCENTAGE, UnitOfTemperature, UnitOfElectricPotential, LIGHT_LUX, UnitOfTime, EntityCategory
 from homeassistant.core import callback
-from .const import DOMAIN
-from .utils import convert_statetype_value, camel_to_snake
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from .const import DOMAIN, AGGREGATE_STATE_TYPES
+from .aggregates import AGGREGATE_STATS
+from .utils import camel_to_snake
 
 import logging
 import datetime
+import time
 
 _LOGGER = logging.getLogger(__name__)
 
+# Static description per state type, resolved once when the entity is created
+SENSOR_DESCRIPTIONS = {
+    description.key: description for description in (
+        SensorEntityDescription(key="moisture", translation_key="moisture", device_class=SensorDeviceClass.MOISTURE, icon="mdi:water-percent", native_unit_of_measurement=PERCENTAGE, state_class=SensorStateClass.MEASUREMENT),
+        SensorEntityDescription(key="temperature", translation_key="temperature", device_class=SensorDeviceClass.TEMPERATURE, icon="mdi:thermometer", native_unit_of_measurement=UnitOfTemperature.CELSIUS, state_class=SensorStateClass.MEASUREMENT),
+        SensorEntityDescription(key="brightness", translation_key="brightness", device_class=SensorDeviceClass.ILLUMINANCE, icon="mdi:brightness-5", native_unit_of_measurement=LIGHT_LUX, state_class=SensorStateClass.MEASUREMENT),
+        SensorEntityDescription(key="solarVoltage", translation_key="solar_voltage", device_class=SensorDeviceClass.VOLTAGE, icon="mdi:solar-power-variant", native_unit_of_measurement=UnitOfElectricPotential.VOLT, state_class=SensorStateClass.MEASUREMENT),
+        SensorEntityDescription(key="lastUpdate", translation_key="last_update", device_class=SensorDeviceClass.TIMESTAMP, icon="mdi:clock-time-four"),
+        SensorEntityDescription(key="circuitName", translation_key="circuit_name", icon="mdi:transit-connection-variant"),
+    )
+}
+
+def _aggregate_description(source: SensorEntityDescription, stat: str) -> SensorEntityDescription:
+    """Derive the description of a rolling statistic from the one of its source value."""
+    if stat == "rate":
+        return replace(source, key=f"{source.key}_{stat}", translation_key=f"{source.translation_key}_{stat}", device_class=None, native_unit_of_measurement=f"{source.native_unit_of_measurement}/h", state_class=SensorStateClass.MEASUREMENT)
+    return replace(source, key=f"{source.key}_{stat}", translation_key=f"{source.translation_key}_{stat}", state_class=SensorStateClass.MEASUREMENT)
+
+# (state type, statistic) -> description of the rolling aggregate sensors
+AGGREGATE_DESCRIPTIONS = {
+    (state, stat): _aggregate_description(SENSOR_DESCRIPTIONS[state], stat)
+    for state in AGGREGATE_STATE_TYPES
+    for stat in AGGREGATE_STATS
+}
+
+@dataclass(frozen=True, kw_only=True)
+class MiyoMetricSensorEntityDescription(SensorEntityDescription):
+    """Describes a diagnostic sensor reading a value from the hub's LinkMetrics."""
+
+    value_fn: Callable
+
+def _round(value, digits=2):
+    return None if value is None else round(value, digits)
+
+def _timestamp(value):
+    return None if value is None else datetime.datetime.fromtimestamp(value, tz=datetime.timezone.utc)
+
+# Runtime metrics of the cube connection, disabled by default and polled instead of pushed
+METRIC_DESCRIPTIONS = (
+    MiyoMetricSensorEntityDescription(key="messages_per_second", translation_key="messages_per_second", icon="mdi:message-flash", native_unit_of_measurement="msg/s", state_class=SensorStateClass.MEASUREMENT, value_fn=lambda metrics: _round(metrics.message_rate.rate)),
+    MiyoMetricSensorEntityDescription(key="parse_time", translation_key="parse_time", icon="mdi:timer-outline", native_unit_of_measurement=UnitOfTime.MILLISECONDS, state_class=SensorStateClass.MEASUREMENT, value_fn=lambda metrics: _round(metrics.parse_time.average, 3)),
+    MiyoMetricSensorEntityDescription(key="dispatch_time", translation_key="dispatch_time", icon="mdi:timer-outline", native_unit_of_measurement=UnitOfTime.MILLISECONDS, state_class=SensorStateClass.MEASUREMENT, value_fn=lambda metrics: _round(metrics.dispatch_time.average, 3)),
+    MiyoMetricSensorEntityDescription(key="command_round_trip", translation_key="command_round_trip", icon="mdi:swap-horizontal", native_unit_of_measurement=UnitOfTime.MILLISECONDS, state_class=SensorStateClass.MEASUREMENT, value_fn=lambda metrics: _round(metrics.command_rtt.average, 1)),
+    MiyoMetricSensorEntityDescription(key="ping_round_trip", translation_key="ping_round_trip", icon="mdi:lan-pending", native_unit_of_measurement=UnitOfTime.MILLISECONDS, state_class=SensorStateClass.MEASUREMENT, value_fn=lambda metrics: _round(metrics.ping_rtt.average, 1)),
+    MiyoMetricSensorEntityDescription(key="missed_pongs", translation_key="missed_pongs", icon="mdi:lan-disconnect", state_class=SensorStateClass.TOTAL_INCREASING, value_fn=lambda metrics: metrics.missed_pongs),
+    MiyoMetricSensorEntityDescription(key="reconnects", translation_key="reconnects", icon="mdi:connection", state_class=SensorStateClass.TOTAL_INCREASING, value_fn=lambda metrics: metrics.reconnects),
+    MiyoMetricSensorEntityDescription(key="connected_since", translation_key="connected_since", device_class=SensorDeviceClass.TIMESTAMP, value_fn=lambda metrics: _timestamp(metrics.connected_since)),
+    MiyoMetricSensorEntityDescription(key="malformed_frames", translation_key="malformed_frames", icon="mdi:message-alert", state_class=SensorStateClass.TOTAL_INCREASING, value_fn=lambda metrics: metrics.malformed_frames),
+    MiyoMetricSensorEntityDescription(key="dropped_frames", translation_key="dropped_frames", icon="mdi:message-minus", state_class=SensorStateClass.TOTAL_INCREASING, value_fn=lambda metrics: metrics.dropped_frames),
+    MiyoMetricSensorEntityDescription(key="queue_depth", translation_key="queue_depth", icon="mdi:tray-full", state_class=SensorStateClass.MEASUREMENT, value_fn=lambda metrics: metrics.queue_depth),
+    MiyoMetricSensorEntityDescription(key="command_queue_depth", translation_key="command_queue_depth", icon="mdi:tray-arrow-up", state_class=SensorStateClass.MEASUREMENT, value_fn=lambda metrics: metrics.command_queue_depth),
+    MiyoMetricSensorEntityDescription(key="commands_expired", translation_key="commands_expired", icon="mdi:timer-alert-outline", state_class=SensorStateClass.TOTAL_INCREASING, value_fn=lambda metrics: metrics.commands_expired),
+)
+
 async def async_setup_entry(hass, entry, async_add_entities):
-    """Set up the sensor entity from config entry."""    
+    """Set up the sensor entities from config entry."""
+    hub = hass.data[DOMAIN][entry.entry_id]
+    # Adds the entities of the known circuits now and of circuits or devices appearing later
+    hub.register_platform(_circuit_entities, async_add_entities)
 
-    circuits_data = hass.data[DOMAIN][entry.entry_id]
+    async_add_entities([MiyoMetricSensor(hub, description) for description in METRIC_DESCRIPTIONS])
+
+def _circuit_entities(hub, circuit) -> list:
+    """Create the sensor entities of one circuit and its devices."""
     entities = []
-    cube_id = entry.data.get('cube_uuid')
+    cube_id = hub.cube_id
 
-    for circuit in circuits_data:
-        
-        circuit_id      = circuit["id"]
-        circuit_name    = f"{circuit["name"]}"
-
-        sensor = circuit.get("sensor")
-        if sensor and sensor.get("id"):
-            sensor_id = sensor["id"]
-            sensor_ip = sensor["ip"]
-            device_name = f"{sensor_ip.replace('%zmd0', '')[-7:]}"       
-            entities.append(MiyoSensor(hass, cube_id, circuit_id, sensor_id, "moistureOutdoor", device_name, "moisture", sensor["stateTypes"].get("moisture", None)))
-            entities.append(MiyoSensor(hass, cube_id, circuit_id, sensor_id, "moistureOutdoor", device_name, "temperature", sensor["stateTypes"].get("temperature", None)))
-            entities.append(MiyoSensor(hass, cube_id, circuit_id, sensor_id, "moistureOutdoor", device_name, "brightness", sensor["stateTypes"].get("brightness", None)))
-            entities.append(MiyoSensor(hass, cube_id, circuit_id, sensor_id, "moistureOutdoor", device_name, "solarVoltage", sensor["stateTypes"].get("solarVoltage", None)))
-            entities.append(MiyoSensor(hass, cube_id, circuit_id, sensor_id, "moistureOutdoor", device_name, "lastUpdate", sensor.get("lastUpdate", None)))
-            entities.append(MiyoSensor(hass, cube_id, circuit_id, sensor_id, "moistureOutdoor", device_name, "circuitName", circuit_name))
-
-        valves = circuit.get("valves", [])
-        for valve in valves:
-            if valve.get("id"):
-                valve_id = valve["id"]
-                valve_ip = valve["ip"]
-                valve_hardware_revision = valve.get("hardwareRevision", 0)
-
-                device_name = f"{valve_ip.replace('%zmd0', '')[-7:]}"                
-                
-                entities.append(MiyoSensor(hass, cube_id, circuit_id, valve_id, "valve", device_name, "solarVoltage", valve["stateTypes"].get("solarVoltage", None)))
-                entities.append(MiyoSensor(hass, cube_id, circuit_id, valve_id, "valve", device_name, "lastUpdate", valve.get("lastUpdate", None)))
-                entities.append(MiyoSensor(hass, cube_id, circuit_id, valve_id, "valve", device_name, "circuitName", circuit_name))
-
-    async_add_entities(entities)
+    circuit_id      = circuit["id"]
+
+    sensor = circuit.get("sensor")
+    if sensor and sensor.get("id"):
+        sensor_id = sensor["id"]
+        sensor_ip = sensor["ip"]
+        device_name = f"{sensor_ip.replace('%zmd0', '')[-7:]}"       
+        entities.append(MiyoSensor(hub, cube_id, circuit_id, sensor_id, "moistureOutdoor", device_name, "moisture"))
+        entities.append(MiyoSensor(hub, cube_id, circuit_id, sensor_id, "moistureOutdoor", device_name, "temperature"))
+        entities.append(MiyoSensor(hub, cube_id, circuit_id, sensor_id, "moistureOutdoor", device_name, "brightness"))
+        entities.append(MiyoSensor(hub, cube_id, circuit_id, sensor_id, "moistureOutdoor", device_name, "solarVoltage"))
+        entities.append(MiyoSensor(hub, cube_id, circuit_id, sensor_id, "moistureOutdoor", device_name, "lastUpdate"))
+        entities.append(MiyoSensor(hub, cube_id, circuit_id, sensor_id, "moistureOutdoor", device_name, "circuitName"))
+        for state in AGGREGATE_STATE_TYPES:
+            for hours in hub.aggregate_windows:
+                for stat in AGGREGATE_STATS:
+                    entities.append(MiyoAggregateSensor(hub, cube_id, circuit_id, sensor_id, "moistureOutdoor", device_name, state, hours, stat))
+
+    valves = circuit.get("valves", [])
+    for valve in valves:
+        if valve.get("id"):
+            valve_id = valve["id"]
+            valve_ip = valve["ip"]
+            valve_hardware_revision = valve.get("hardwareRevision", 0)
+
+            device_name = f"{valve_ip.replace('%zmd0', '')[-7:]}"                
+            
+            entities.append(MiyoSensor(hub, cube_id, circuit_id, valve_id, "valve", device_name, "solarVoltage"))
+            entities.append(MiyoSensor(hub, cube_id, circuit_id, valve_id, "valve", device_name, "lastUpdate"))
+            entities.append(MiyoSensor(hub, cube_id, circuit_id, valve_id, "valve", device_name, "circuitName"))
+
+    return entities
 
     
 
 class MiyoSensor(SensorEntity):
     """Sensor receiving updates via WS."""
 
-    def __init__(self, hass, cube_id: str, circuit_id: str, device_id: str, device_type: str, device_name: str, state: str, init_value = None):
+    _attr_should_poll = False
+
+    def __init__(self, hub, cube_id: str, circuit_id: str, device_id: str, device_type: str, device_name: str, state: str):
         """
         Parameters:
-            hass: HomeAssistant core object
+            hub: MiyoHub of the config entry
             cube_id: ID of the Miyo cube
             circuit_id: ID of the circuit
             device_id: ID of the sensor device
@@ -65,10 +133,10 @@ class MiyoSensor(SensorEntity):
             deviceName: Name of the device
             state: Type of state this sensor represents (e.g., "moisture", "temperature")            
         """
-        self.hass = hass
+        self.hass = hub.hass
+        self._hub = hub
         self._device_id         = device_id
         self._statetype         = state
-        self._state             = None
         self._device_name       = device_name
         self._device_type       = device_type
         
@@ -76,109 +144,141 @@ class MiyoSensor(SensorEntity):
 
         self._attr_unique_id    = f"{device_id}_{state}"
         self._attr_has_entity_name = True
-        self._attr_translation_key = camel_to_snake(state)
+        self._attr_device_info  = hub.device_info(device_id, device_type, device_name, circuit_id)
+        self.entity_description = SENSOR_DESCRIPTIONS.get(state) or SensorEntityDescription(key=state, translation_key=camel_to_snake(state), icon="mdi:sensor")
 
-        if init_value is not None: 
-            self._state = convert_statetype_value(self._statetype, init_value)
+        self._hysteresis        = hub.state_filter.get(state)
+        self._written           = None
+        self._written_at        = 0.0
+        self._write_handle      = None
 
     #
     #  ---------- HA Entity Properties ----------
     #
 
     @property
-    def native_value(self):
-        return self._state
-
-    @property
-    def device_class(self):
-        if self._statetype == "moisture":
-            return "moisture"
-        elif self._statetype == "temperature":
-            return "temperature"
-        elif self._statetype == "brightness":
-            return "illuminance"
-        elif self._statetype == "solarVoltage":
-            return "voltage"
-        elif self._statetype == "lastUpdate":
-            return "timestamp"
-        else:
-            return None
-
-    @property
-    def icon(self):
-        if self._statetype == "moisture":
-            return "mdi:water-percent"
-        elif self._statetype == "temperature":
-            return "mdi:thermometer"
-        elif self._statetype == "brightness":
-            return "mdi:brightness-5"
-        elif self._statetype == "solarVoltage":
-            return "mdi:solar-power-variant"
-        elif self._statetype == "lastUpdate":
-            return "mdi:clock-time-four"
-        elif self._statetype == "irrigationWasStarted":
-            return "mdi:information-slab-circle"
-        elif self._statetype == "valveStatus" or self._statetype == "valve2Status":
-            return "mdi:pipe-valve"
-        elif self._statetype == "circuitName":
-            return "mdi:transit-connection-variant"
-        else:
-            return "mdi:sensor"
-
-    @property
-    def native_unit_of_measurement(self):        
-        if self._statetype == "moisture":
-            return PERCENTAGE
-        elif self._statetype == "temperature":
-            return UnitOfTemperature.CELSIUS
-        elif self._statetype == "brightness":
-            return LIGHT_LUX
-        elif self._statetype == "solarVoltage":
-            return UnitOfElectricPotential.VOLT
-        else:
-            return None
+    def available(self) -> bool:
+        """Unavailable while the hub only has values restored from its snapshot."""
+        return self._hub.available
 
     @property
-    def device_info(self):
-        """Associate this entity with a HA device."""
-        device_info = {
-            "identifiers": {(DOMAIN, self._device_id)},
-            "translation_key": camel_to_snake(self._device_type),
-            "translation_placeholders": {"id": self._device_name},
-            "manufacturer": "MIYO",
-            "model": "Smart Irrigation"
-        }
-
-        if self._device_type != "circuit":
-            device_info["via_device"] = (DOMAIN, self._circuit_id)
-        
-        return device_info
+    def native_value(self):
+        """The last value that passed the state filter, so writes for other reasons never bypass the deadband."""
+        return self._written
 
     #
     #  ---------- WS Handling ----------
     #
     @callback
-    async def _handle_update(self, event):
-        updates = event.data
-
-        for data in updates:
-            if "device_id" in data and "state_type" in data and "value" in data:
-                device_id = data["device_id"]
-                state_type = data["state_type"]
-                value = data["value"]
-
-                if device_id == self._device_id and state_type == self._statetype:
-                    self._state = value
-                    self.async_write_ha_state()
-        
+    def _handle_update(self, value):
+        """Handle a new value for this entity's device and state type, skipping changes within the deadband."""
+        delay = self._hysteresis.write_delay(self._written, self._written_at, value, time.monotonic())
+        if delay is None:
+            return
+        if delay:
+            # Rate limited or waiting for the heartbeat, the latest value is written when the earliest deadline passes
+            loop = self.hass.loop
+            if self._write_handle is None or self._write_handle.when() > loop.time() + delay:
+                if self._write_handle is not None:
+                    self._write_handle.cancel()
+                self._write_handle = loop.call_later(delay, self._write_state)
+            return
+        self._write_state()
+
+    @callback
+    def _write_state(self):
+        if self._write_handle is not None:
+            self._write_handle.cancel()
+            self._write_handle = None
+        self._written = self._hub.store.get(self._device_id, self._statetype)
+        self._written_at = time.monotonic()
+        self.async_write_ha_state()
 
     async def async_added_to_hass(self):
-        """Subscribe to WS event when entity is added."""
-        self._unsub = self.hass.bus.async_listen(f"{DOMAIN}_update", self._handle_update)
+        """Subscribe to WS updates for this entity when it is added."""
+        self._written = self._hub.store.get(self._device_id, self._statetype)
+        self._written_at = time.monotonic()
+        self._unsub = self._hub.dispatcher.subscribe(self._device_id, self._statetype, self._handle_update)
+        self.async_on_remove(async_dispatcher_connect(self.hass, self._hub.signal_available, self.async_write_ha_state))
 
     async def async_will_remove_from_hass(self):
-        """Unsubscribe from WS event when entity is removed."""
+        """Unsubscribe from WS updates when entity is removed."""
         if hasattr(self, "_unsub") and self._unsub is not None:
             self._unsub()
             self._unsub = None
+        if self._write_handle is not None:
+            self._write_handle.cancel()
+            self._write_handle = None
+
+class MiyoAggregateSensor(SensorEntity):
+    """Rolling min, max, mean or rate of change of a sensor value over a window of hours."""
+
+    def __init__(self, hub, cube_id: str, circuit_id: str, device_id: str, device_type: str, device_name: str, state: str, hours: int, stat: str):
+        """
+        Parameters:
+            hub: MiyoHub of the config entry
+            cube_id: ID of the Miyo cube
+            circuit_id: ID of the circuit
+            device_id: ID of the sensor device
+            device_type: Type of the device
+            deviceName: Name of the device
+            state: Type of state aggregated (e.g., "moisture")
+            hours: Length of the window in hours
+            stat: One of AGGREGATE_STATS
+        """
+        self.hass = hub.hass
+        self._hub = hub
+        self._device_id         = device_id
+        self._statetype         = state
+        self._stat              = stat
+        self._circuit_id        = circuit_id
+
+        self._attr_unique_id    = f"{device_id}_{state}_{stat}_{hours}h"
+        self._attr_has_entity_name = True
+        self._attr_translation_placeholders = {"hours": str(hours)}
+        self._attr_device_info  = hub.device_info(device_id, device_type, device_name, circuit_id)
+        self.entity_description = AGGREGATE_DESCRIPTIONS[(state, stat)]
+        # Shared by the statistics of the same value and window, fed even while this entity is disabled
+        self._window            = hub.aggregates.window(device_id, state, hours, hub.store.get(device_id, state))
+        self._written           = None
+
+    #
+    #  ---------- HA Entity Properties ----------
+    #
 
+    @property
+    def native_value(self):
+        return _round(self._window.value(self._stat))
+
+    #
+    #  ---------- WS Handling ----------
+    #
+    @callback
+    def _handle_update(self, value):
+        """Write the statistic when a new sample changed it, polling covers samples leaving the window."""
+        written = self.native_value
+        if written != self._written:
+            self._written = written
+            self.async_write_ha_state()
+
+    async def async_added_to_hass(self):
+        self._written = self.native_value
+        self.async_on_remove(self._hub.dispatcher.subscribe(self._device_id, self._statetype, self._handle_update))
+
+class MiyoMetricSensor(SensorEntity):
+    """Diagnostic sensor exposing a runtime metric of the cube connection."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+    _attr_has_entity_name = True
+
+    def __init__(self, hub, description: MiyoMetricSensorEntityDescription):
+        self.hass = hub.hass
+        self._hub = hub
+        self.entity_description = description
+        self._attr_unique_id    = f"{hub.cube_id}_{description.key}"
+        self._attr_device_info  = hub.device_info(hub.cube_id, "cube", hub.host, None)
+
+    @property
+    def native_value(self):
+        return self.entity_description.value_fn(self._hub.metrics)
@@ -0,0 +1,93 @@
+import logging
+import voluptuous as vol
+from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.exceptions import ServiceValidationError
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.entity_registry import async_get as async_get_entity_registry
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+SERVICE_START_IRRIGATION = "start_irrigation"
+SERVICE_STOP_IRRIGATION = "stop_irrigation"
+
+ATTR_CIRCUITS = "circuits"
+ATTR_CIRCUIT = "circuit"
+ATTR_DURATION = "duration"
+ATTR_MAX_CONCURRENT = "max_concurrent"
+
+START_IRRIGATION_SCHEMA = vol.Schema({
+    vol.Required(ATTR_CIRCUITS): vol.All(cv.ensure_list, [vol.Schema({
+        vol.Required(ATTR_CIRCUIT): cv.string,
+        vol.Optional(ATTR_DURATION): vol.All(vol.Coerce(int), vol.Range(min=1, max=60)),
+    })]),
+    vol.Optional(ATTR_MAX_CONCURRENT, default=1): vol.All(vol.Coerce(int), vol.Range(min=1, max=20)),
+})
+
+STOP_IRRIGATION_SCHEMA = vol.Schema({
+    vol.Optional(ATTR_CIRCUITS): vol.All(cv.ensure_list, [cv.string]),
+})
+
+def _resolve_circuit(hass: HomeAssistant, reference: str):
+    """Find the hub and circuit id for a circuit id, a circuit name or the entity id of a circuit entity."""
+    hubs = list(hass.data.get(DOMAIN, {}).values())
+
+    circuit_id = reference.strip("{}")
+    entity = async_get_entity_registry(hass).async_get(reference)
+    if entity is not None and entity.platform == DOMAIN:
+        # Unique ids are <device id>_<state type>
+        circuit_id = entity.unique_id.rsplit("_", 1)[0]
+
+    named = []
+    for hub in hubs:
+        for circuit in hub.circuits or ():
+            if circuit["id"] == circuit_id:
+                return hub, circuit_id
+            if (circuit.get("name") or "").casefold() == reference.casefold():
+                named.append((hub, circuit["id"]))
+
+    if len(named) > 1:
+        raise ServiceValidationError(f"Ambiguous MIYO circuit name, use the circuit id or entity id: {reference}")
+    if named:
+        return named[0]
+    raise ServiceValidationError(f"Unknown MIYO circuit: {reference}")
+
+def async_setup_services(hass: HomeAssistant):
+    """Register the irrigation services, once for all config entries."""
+
+    async def async_start_irrigation(call: ServiceCall):
+        plans = {}
+        for item in call.data[ATTR_CIRCUITS]:
+            hub, circuit_id = _resolve_circuit(hass, item[ATTR_CIRCUIT])
+            # Without a duration the circuit runs for the one set on its duration number
+            duration = item.get(ATTR_DURATION, hub.circuit(circuit_id).duration)
+            if duration is None:
+                raise ServiceValidationError(f"No irrigation duration given or set for MIYO circuit: {item[ATTR_CIRCUIT]}")
+            plans.setdefault(hub, []).append((circuit_id, duration))
+        # Each cube has its own water supply, the limit applies per cube
+        for hub, plan in plans.items():
+            _LOGGER.info("Starting irrigation plan on %s: %s", hub.host, plan)
+            hub.scheduler.start_plan(plan, call.data[ATTR_MAX_CONCURRENT])
+
+    async def async_stop_irrigation(call: ServiceCall):
+        if ATTR_CIRCUITS in call.data:
+            targets = {}
+            for reference in call.data[ATTR_CIRCUITS]:
+                hub, circuit_id = _resolve_circuit(hass, reference)
+                targets.setdefault(hub, []).append(circuit_id)
+            for hub, circuit_ids in targets.items():
+                await hub.scheduler.async_stop(circuit_ids)
+            return
+
+        for hub in list(hass.data.get(DOMAIN, {}).values()):
+            # Cancel the plan, then stop whatever else is irrigating, e.g. started by a button or the cube itself
+            await hub.scheduler.async_stop()
+            irrigating = [
+                circuit["id"] for circuit in hub.circuits or ()
+                if hub.store.get(circuit["id"], "irrigationWasStarted") is True
+            ]
+            if irrigating:
+                await hub.scheduler.async_stop(irrigating)
+
+    hass.services.async_register(DOMAIN, SERVICE_START_IRRIGATION, async_start_irrigation, schema=START_IRRIGATION_SCHEMA)
+    hass.services.async_register(DOMAIN, SERVICE_STOP_IRRIGATION, async_stop_irrigation, schema=STOP_IRRIGATION_SCHEMA)
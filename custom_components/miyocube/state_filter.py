@@ -0,0 +1,65 @@
+from .const import DEADBAND_OPTIONS, CONF_MIN_WRITE_INTERVAL, DEFAULT_MIN_WRITE_INTERVAL, CONF_WRITE_HEARTBEAT, DEFAULT_WRITE_HEARTBEAT
+
+class Hysteresis:
+    """Decides whether a new value of a noisy state type is worth a state write."""
+
+    __slots__ = ("absolute", "relative", "min_interval", "heartbeat")
+
+    def __init__(self, absolute: float = 0.0, relative: float = 0.0, min_interval: float = 0.0, heartbeat: float = 0.0):
+        """
+        Parameters:
+            absolute: Changes up to this amount are ignored
+            relative: Changes up to this fraction of the written value are ignored
+            min_interval: Minimum seconds between two writes, later changes are written when it has passed
+            heartbeat: Seconds after the last write at which a change within the deadband is written, 0 disables it
+        """
+        self.absolute       = absolute
+        self.relative       = relative
+        self.min_interval   = min_interval
+        self.heartbeat      = heartbeat
+
+    def significant(self, written, value) -> bool:
+        """True if value lies outside the deadband around the written value."""
+        if written == value:
+            return False
+        if not isinstance(written, (int, float)) or not isinstance(value, (int, float)):
+            return True
+        delta = abs(value - written)
+        return delta > self.absolute and delta > self.relative * abs(written)
+
+    def write_delay(self, written, written_at: float, value, now: float):
+        """Return None to skip the write, 0 to write now or the seconds to wait before writing."""
+        elapsed = now - written_at
+        if not self.significant(written, value):
+            if not self.heartbeat or written == value:
+                return None
+            # Within the deadband, written once the heartbeat has passed even if no further update arrives
+            return max(self.heartbeat - elapsed, self.min_interval - elapsed, 0)
+        if elapsed < self.min_interval:
+            return self.min_interval - elapsed
+        return 0
+
+# Writes every change right away
+NO_HYSTERESIS = Hysteresis()
+
+class StateFilter:
+    """Hysteresis per state type, built from the options of the config entry."""
+
+    def __init__(self, rules: dict):
+        self._rules = rules
+
+    @classmethod
+    def from_options(cls, options: dict) -> "StateFilter":
+        min_interval = options.get(CONF_MIN_WRITE_INTERVAL, DEFAULT_MIN_WRITE_INTERVAL)
+        heartbeat = options.get(CONF_WRITE_HEARTBEAT, DEFAULT_WRITE_HEARTBEAT)
+        rules = {}
+        for state_type, (option, default, relative) in DEADBAND_OPTIONS.items():
+            deadband = options.get(option, default)
+            if relative:
+                rules[state_type] = Hysteresis(relative=deadband / 100, min_interval=min_interval, heartbeat=heartbeat)
+            else:
+                rules[state_type] = Hysteresis(absolute=deadband, min_interval=min_interval, heartbeat=heartbeat)
+        return cls(rules)
+
+    def get(self, state_type: str) -> Hysteresis:
+        return self._rules.get(state_type, NO_HYSTERESIS)
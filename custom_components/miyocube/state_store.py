@@ -0,0 +1,56 @@
+import sys
+
+class StateRecord:
+    """Current value of one state type of one device."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value      = value
+
+class MiyoStateStore:
+    """Authoritative per-cube state, one slotted record per interned (device_id, state_type)."""
+
+    def __init__(self):
+        self._records = {}
+
+    def __len__(self):
+        return len(self._records)
+
+    @staticmethod
+    def key(device_id: str, state_type: str):
+        """Build the record key, interning both parts so repeated ids share one string."""
+        return (sys.intern(device_id), sys.intern(state_type))
+
+    def get(self, device_id: str, state_type: str, default=None):
+        """Return the current value or default if the state is unknown."""
+        record = self._records.get((device_id, state_type))
+        return default if record is None else record.value
+
+    def set(self, device_id: str, state_type: str, value) -> bool:
+        """Store a value, returns True if it differs from the previous one."""
+        record = self._records.get((device_id, state_type))
+        if record is None:
+            self._records[self.key(device_id, state_type)] = StateRecord(value)
+            return True
+        if record.value == value:
+            return False
+        record.value = value
+        return True
+
+    def discard(self, device_id: str):
+        """Forget all states of a device that was removed from the cube."""
+        for key in [key for key in self._records if key[0] == device_id]:
+            del self._records[key]
+
+    def differs(self, device_id: str, state_type: str, value) -> bool:
+        """Return True if value is unknown or differs from the stored one."""
+        record = self._records.get((device_id, state_type))
+        return record is None or record.value != value
+
+    def snapshot(self) -> dict:
+        """Return {device_id: {state_type: value}} for diagnostics and persistence."""
+        snapshot = {}
+        for (device_id, state_type), record in self._records.items():
+            snapshot.setdefault(device_id, {})[state_type] = record.value
+        return snapshot
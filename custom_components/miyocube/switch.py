@@ -1,39 +1,54 @@
 from __future__ import annotations
-from homeassistant.components.switch import SwitchEntity
+from homeassistant.components.switch import SwitchEntity, SwitchEntityDescription, SwitchDeviceClass
 from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.exceptions import HomeAssistantError
 from .const import DOMAIN
-from .utils import convert_statetype_value, camel_to_snake
+from .ws_client import WSCommandError
+from .utils import camel_to_snake
 import logging
 import datetime
 
 _LOGGER = logging.getLogger(__name__)
 
+# Static description per state type, resolved once when the entity is created
+SWITCH_DESCRIPTIONS = {
+    description.key: description for description in (
+        SwitchEntityDescription(key="automaticMode", translation_key="automatic_mode", device_class=SwitchDeviceClass.SWITCH, icon="mdi:robot"),
+        SwitchEntityDescription(key="valveStaggering", translation_key="valve_staggering", device_class=SwitchDeviceClass.SWITCH, icon="mdi:stairs"),
+    )
+}
+
 async def async_setup_entry(hass, entry, async_add_entities):
-    """Set up the sensor entity from config entry."""    
+    """Set up the switch entities from config entry."""
+    hub = hass.data[DOMAIN][entry.entry_id]
+    # Adds the entities of the known circuits now and of circuits or devices appearing later
+    hub.register_platform(_circuit_entities, async_add_entities)
 
-    circuits_data = hass.data[DOMAIN][entry.entry_id]
+def _circuit_entities(hub, circuit) -> list:
+    """Create the switch entities of one circuit and its devices."""
     entities = []
-    cube_id = entry.data.get('cube_uuid')
+    cube_id = hub.cube_id
 
-    for circuit in circuits_data:
-        
-        circuit_id      = circuit["id"]
-        circuit_name    = f"{circuit["name"]}"
+    circuit_id      = circuit["id"]
+    circuit_name    = f"{circuit["name"]}"
 
-        entities.append(MiyoSwitch(hass, cube_id, circuit_id, circuit_id, "circuit", circuit_name, "automaticMode", circuit["params"].get("automaticMode", None)))
-        entities.append(MiyoSwitch(hass, cube_id, circuit_id, circuit_id, "circuit", circuit_name, "valveStaggering", circuit["params"].get("valveStaggering", None)))
+    entities.append(MiyoSwitch(hub, cube_id, circuit_id, circuit_id, "circuit", circuit_name, "automaticMode"))
+    entities.append(MiyoSwitch(hub, cube_id, circuit_id, circuit_id, "circuit", circuit_name, "valveStaggering"))
 
-    async_add_entities(entities)
+    return entities
 
     
 
 class MiyoSwitch(SwitchEntity):
     """Switch receiving updates via WS."""
 
-    def __init__(self, hass, cube_id: str, circuit_id: str, device_id: str, device_type: str, device_name: str, state: str, init_value = None):
+    _attr_should_poll = False
+
+    def __init__(self, hub, cube_id: str, circuit_id: str, device_id: str, device_type: str, device_name: str, state: str):
         """
         Parameters:
-            hass: HomeAssistant core object
+            hub: MiyoHub of the config entry
             cube_id: ID of the Miyo cube
             circuit_id: ID of the circuit
             device_id: ID of the sensor device
@@ -41,110 +56,69 @@ class MiyoSwitch(SwitchEntity):
             deviceName: Name of the device
             state: Type of state this sensor represents (e.g., "moisture", "temperature")            
         """
-        self.hass = hass
+        self.hass = hub.hass
+        self._hub = hub
         self._device_id         = device_id
         self._statetype         = state
         self._device_name       = device_name
         self._device_type       = device_type
-        self._state             = None
         self._circuit_id        = circuit_id
 
         self._attr_unique_id    = f"{device_id}_{state}"
         self._attr_has_entity_name = True
-        self._attr_translation_key = camel_to_snake(state)
-
-        if init_value is not None: 
-            self._state = convert_statetype_value(self._statetype, init_value)
+        self._attr_device_info  = hub.device_info(device_id, device_type, device_name, circuit_id)
+        self.entity_description = SWITCH_DESCRIPTIONS.get(state) or SwitchEntityDescription(key=state, translation_key=camel_to_snake(state), device_class=SwitchDeviceClass.SWITCH, icon="mdi:sensor")
 
     #
     #  ---------- HA Entity Properties ----------
     #
 
+    @property
+    def available(self) -> bool:
+        """Unavailable while the hub only has values restored from its snapshot."""
+        return self._hub.available
+
     @property
     def is_on(self):
         """Return true if switch is on."""
-        return self._state is True
+        return self._hub.store.get(self._device_id, self._statetype) is True
 
     @property
     def native_value(self):
-        return self._state
-
-    @property
-    def device_class(self):
-        return "switch"
-
-    @property
-    def icon(self):
-        if self._statetype == "automaticMode":
-            return "mdi:robot"
-        elif self._statetype == "valveStaggering":
-            return "mdi:stairs"
-        else:
-            return "mdi:sensor"
-
-    @property
-    def device_info(self):
-        """Associate this entity with a HA device."""
-        device_info = {
-            "identifiers": {(DOMAIN, self._device_id)},
-            "translation_key": camel_to_snake(self._device_type),
-            "translation_placeholders": {"id": self._device_name},
-            "manufacturer": "MIYO",
-            "model": "Smart Irrigation"
-        }
-
-        if self._device_type != "circuit":
-            device_info["via_device"] = (DOMAIN, self._circuit_id)
-        
-        return device_info
+        return self._hub.store.get(self._device_id, self._statetype)
 
     #
     #  ---------- WS Handling ----------
     #
     @callback
-    async def _handle_update(self, event):
-        updates = event.data
-        for data in updates:
-            if "device_id" in data and "state_type" in data and "value" in data:
-                device_id = data["device_id"]
-                state_type = data["state_type"]
-                value = data["value"]
-
-                if device_id == self._device_id and state_type == self._statetype:
-                    self._state = value
-                    self.async_write_ha_state()
-        
+    def _handle_update(self, value):
+        """Handle a new value for this entity's device and state type."""
+        self.async_write_ha_state()
 
     async def async_added_to_hass(self):
-        """Subscribe to WS event when entity is added."""
-        self._unsub = self.hass.bus.async_listen(f"{DOMAIN}_update", self._handle_update)
+        """Subscribe to WS updates for this entity when it is added."""
+        self._unsub = self._hub.dispatcher.subscribe(self._device_id, self._statetype, self._handle_update)
+        self.async_on_remove(async_dispatcher_connect(self.hass, self._hub.signal_available, self.async_write_ha_state))
 
     async def async_turn_on(self, **kwargs):
         """Turn the switch on."""
-        ws_client = self.hass.data[DOMAIN]["ws_client"]
-        await ws_client.send({
-            "method": "Circuit.edit",            
-            "params": {
-                "circuitId": self._circuit_id,
-                "state_type": self._statetype,
-                self._statetype: True
-            }
-        })
+        await self._async_edit(True)
 
     async def async_turn_off(self, **kwargs):
         """Turn the switch off."""
-        ws_client = self.hass.data[DOMAIN]["ws_client"]
-        await ws_client.send({
-            "method": "Circuit.edit",            
-            "params": {
-                "circuitId": self._circuit_id,
-                "state_type": self._statetype,
-                self._statetype: False
-            }
-        })
+        await self._async_edit(False)
+
+    async def _async_edit(self, value: bool):
+        """Edit the circuit together with other changes of it within the debounce window and apply the accepted value."""
+        try:
+            params = await self._hub.edits.edit(self._circuit_id, {self._statetype: value})
+        except WSCommandError as e:
+            raise HomeAssistantError(f"MIYO Cube did not accept {self._statetype}={value}: {e}") from e
+
+        self._hub.dispatcher.dispatch([{"device_id": self._device_id, "state_type": self._statetype, "value": params[self._statetype]}])
 
     async def async_will_remove_from_hass(self):
-        """Unsubscribe from WS event when entity is removed."""
+        """Unsubscribe from WS updates when entity is removed."""
         if hasattr(self, "_unsub") and self._unsub is not None:
             self._unsub()
             self._unsub = None
\ No newline at end of file
@@ -1,73 +1,225 @@
 import datetime
+import functools
+import json
 import zoneinfo
 import logging
 import re
 
+try:
+    # orjson ships with Home Assistant and decodes several times faster than the stdlib
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
 _LOGGER = logging.getLogger(__name__)
 
+@functools.lru_cache(maxsize=None)
 def camel_to_snake(name):
     """Convert camelCase or PascalCase to snake_case."""
     return re.sub(r'(?<!^)(?=[A-Z])', '_', name).lower()
 
+@functools.lru_cache(maxsize=4096)
+def normalize_id(raw_id):
+    """Strip the curly braces from a cube GUID, cached since the same ids repeat in every message."""
+    return raw_id.replace("{", "").replace("}", "")
+
+def _parse_device_state_changed(params):
+    state_type = params.get("type")
+    value = convert_statetype_value(state_type, params.get("value"))
+    return [{"device_id": normalize_id(params.get("deviceId")), "state_type": state_type, "value": value}]
+
+def _parse_device_updated(params):
+    lastUpdate = convert_statetype_value("lastUpdate", params.get("lastUpdate"))
+    return [{"device_id": normalize_id(params.get("id")), "state_type": "lastUpdate", "value": lastUpdate}]
+
+def _parse_circuit_state_changed(params):
+    state_type = params.get("type")
+    value = convert_statetype_value(state_type, params.get("value"))
+    return [{"device_id": normalize_id(params.get("circuitId")), "state_type": state_type, "value": value}]
+
+def _parse_circuit_edited(params):
+    circuit = params.get("circuit", {})
+    if is_full_circuit(circuit):
+        return circuit_updates([parse_circuit(circuit.get("id"), circuit)])
+    circuit_id = normalize_id(circuit.get("id"))
+    circuitParams = circuit.get("params", {})
+    value_automaticMode = convert_statetype_value("automaticMode", str(circuitParams.get("automaticMode")))
+    value_valveStaggering = convert_statetype_value("valveStaggering", str(circuitParams.get("valveStaggering")))
+    return [{"device_id": circuit_id, "state_type": "automaticMode", "value": value_automaticMode},
+            {"device_id": circuit_id, "state_type": "valveStaggering", "value": value_valveStaggering}]
+
+# Notification name -> parser of its params, everything else is dropped
+NOTIFICATION_PARSERS = {
+    "Device.stateChanged": _parse_device_state_changed,
+    "Device.updated": _parse_device_updated,
+    "Circuit.stateChanged": _parse_circuit_state_changed,
+    "Circuit.edited": _parse_circuit_edited,
+}
+
 def parse_ws_payload(data):
-    """Parse the WS payload and return a dict."""
-        
-    if "notification" not in data: return
-    notification = data["notification"]
-
-    if notification == "Device.stateChanged":
-        params = data.get("params", {})
-        device_id = params.get("deviceId").replace("{","").replace("}","")
-        state_type = params.get("type")
-        value = params.get("value")
-        value = convert_statetype_value(state_type, value)
-        return [{"device_id": device_id, "state_type": state_type, "value": value}]
-    elif notification == "Device.updated":
-        params = data.get("params", {})
-        device_id = params.get("id").replace("{","").replace("}","")
-        lastUpdate = params.get("lastUpdate")
-        lastUpdate = convert_statetype_value("lastUpdate", lastUpdate)
-        return [{"device_id": device_id, "state_type": "lastUpdate", "value": lastUpdate}]
-    elif notification == "Circuit.stateChanged":
-        params = data.get("params", {})
-        device_id = params.get("circuitId").replace("{","").replace("}","")
-        state_type = params.get("type")
-        value = params.get("value")
-        value = convert_statetype_value(state_type, value)
-        return [{"device_id": device_id, "state_type": state_type, "value": value}]
-    elif notification == "Circuit.edited":
-        params = data.get("params", {})
-        circuit = params.get("circuit", {})
-        circuit_id = circuit.get("id").replace("{","").replace("}","")
-        circuitParams = circuit.get("params", {})
-        value_automaticMode = convert_statetype_value("automaticMode", str(circuitParams.get("automaticMode")))
-        value_valveStaggering = convert_statetype_value("valveStaggering", str(circuitParams.get("valveStaggering")))
-        return [{"device_id": circuit_id, "state_type": "automaticMode", "value": value_automaticMode},
-                {"device_id": circuit_id, "state_type": "valveStaggering", "value": value_valveStaggering}]
-    else: 
+    """Parse the WS payload and return a list of updates."""
+    parser = NOTIFICATION_PARSERS.get(data.get("notification"))
+    if parser is None:
         return []
+    return parser(data.get("params", {}))
+
+# Telemetry notification -> params identifying the value it carries, a newer one supersedes an older one.
+# Circuit notifications report irrigation and edits and are never dropped.
+TELEMETRY_KEYS = {
+    "Device.stateChanged": ("deviceId", "type"),
+    "Device.updated": ("id",),
+}
+
+def notification_key(data):
+    """Coalescing key of a telemetry notification, None for anything that must not be dropped."""
+    notification = data.get("notification")
+    fields = TELEMETRY_KEYS.get(notification)
+    if fields is None:
+        return None
+    params = data.get("params", {})
+    return (notification, *(params.get(field) for field in fields))
+
+def parse_circuits(data):
+    """Extract name, id, state types, sensor (ip, id) and valves (ip, id) from a /api/circuit/all response."""
+    return [parse_circuit(circuit_id, circuit) for circuit_id, circuit in data["params"]["circuits"].items()]
+
+def parse_circuit(circuit_id, circuit):
+    """Extract one circuit as listed by /api/circuit/all or carried by a full Circuit.edited notification."""
+    circuitStateTypes = {}
+    for stateType in circuit.get("stateTypes", {}).values():
+        circuitStateTypes[stateType.get("type")] = stateType.get("value")
+
+    sensor_data = circuit.get("sensorData", {})
+    sensorStateTypes = {}
+    for stateType in sensor_data.get("stateTypes", {}).values():
+        sensorStateTypes[stateType.get("type")] = stateType.get("value")
+
+    circuit_info = {
+        "id": normalize_id(circuit_id),
+        "name": circuit.get("name"),
+        "stateTypes": circuitStateTypes,
+        "params": circuit.get("params", {}),
+        "sensor": {
+            "id": sensor_data.get("id"),
+            "ip": sensor_data.get("ipv6"),
+            "lastUpdate": sensor_data.get("lastUpdate"),
+            "stateTypes": sensorStateTypes
+        },
+        "valves": []
+    }
+    valves = circuit.get("valves", {})
+    for valve in valves.values():
+        valve_data = valve.get("valveData", {})
+
+        stateTypes = {}
+        for stateType in valve_data.get("stateTypes", {}).values():
+            stateTypes[stateType.get("type")] = stateType.get("value")
+
+        circuit_info["valves"].append({
+            "id": valve_data.get("id"),
+            "ip": valve_data.get("ipv6"),
+            "lastUpdate": valve_data.get("lastUpdate"),
+            "hardwareRevision": valve_data.get("hardwareRevision"),
+            "channel": valve.get("channel"),
+            "stateTypes": stateTypes
+        })
+
+    return circuit_info
+
+def is_full_circuit(circuit):
+    """True if a Circuit.edited notification carries the devices of the circuit and not only its params."""
+    return "sensorData" in circuit or "valves" in circuit
+
+def circuit_updates(circuits):
+    """Flatten the circuits from the HTTP API into the update dicts produced by parse_ws_payload."""
+    updates = []
+    for circuit in circuits:
+        circuit_id = circuit["id"]
+        for state_type, value in circuit.get("stateTypes", {}).items():
+            updates.append({"device_id": circuit_id, "state_type": state_type, "value": convert_statetype_value(state_type, value)})
+        for state_type in ("automaticMode", "valveStaggering"):
+            if state_type in circuit.get("params", {}):
+                value = convert_statetype_value(state_type, circuit["params"][state_type])
+                updates.append({"device_id": circuit_id, "state_type": state_type, "value": value})
+
+        devices = [circuit.get("sensor") or {}] + list(circuit.get("valves", []))
+        for device in devices:
+            device_id = device.get("id")
+            if not device_id:
+                continue
+            updates.append({"device_id": device_id, "state_type": "circuitName", "value": circuit.get("name")})
+            for state_type, value in device.get("stateTypes", {}).items():
+                updates.append({"device_id": device_id, "state_type": state_type, "value": convert_statetype_value(state_type, value)})
+            if device.get("lastUpdate") is not None:
+                updates.append({"device_id": device_id, "state_type": "lastUpdate", "value": convert_statetype_value("lastUpdate", device["lastUpdate"])})
+    return updates
+
+def _circuit_devices(circuit) -> set:
+    """Ids of a circuit and of its sensor and valves."""
+    ids = {circuit["id"], (circuit.get("sensor") or {}).get("id")}
+    ids.update(valve.get("id") for valve in circuit.get("valves", []))
+    ids.discard(None)
+    return ids
+
+def topology_ids(circuits) -> set:
+    """Ids of all circuits and devices of a topology."""
+    return set().union(*(_circuit_devices(circuit) for circuit in circuits or ()))
+
+def topology_changes(known, circuits):
+    """Compare two circuit lists, returns the circuits that are new or gained a device and the ids of removed devices.
+
+    Only the returned circuits can have entities to add, so the entity factories need not run for the others.
+    """
+    known_devices = {circuit["id"]: _circuit_devices(circuit) for circuit in known or ()}
+    changed = []
+    current = set()
+    for circuit in circuits:
+        devices = _circuit_devices(circuit)
+        current |= devices
+        if known_devices.get(circuit["id"]) != devices:
+            changed.append(circuit)
+    removed = set().union(*known_devices.values()) - current
+    return changed, removed
+
+def _to_datetime(value):
+    try:
+        return datetime.datetime.fromtimestamp(float(value), tz=datetime.timezone.utc)
+    except Exception:
+        return None
+
+def _to_bool(value):
+    if isinstance(value, str):
+        return value.lower() in ("true", "1", "yes")
+    return bool(value)
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
+
+# State type -> converter, state types not listed keep their raw value
+STATETYPE_CONVERTERS = {
+    "lastUpdate": _to_datetime,
+    "irrigationWasStarted": _to_bool,
+    "valveStatus": _to_bool,
+    "valve2Status": _to_bool,
+    "automaticMode": _to_bool,
+    "valveStaggering": _to_bool,
+    "solarVoltage": _to_float,
+    "moisture": _to_int,
+    "brightness": _to_int,
+    "temperature": _to_int,
+    "duration": _to_int,
+}
 
 def convert_statetype_value(statetype, value):
     """Convert a value to the correct type based on statetype."""
-    if statetype == "lastUpdate":
-        try:
-            dt = datetime.datetime.fromtimestamp(float(value), tz=datetime.timezone.utc)
-            return dt
-        except Exception:
-            return None
-    elif statetype in ("irrigationWasStarted", "valveStatus", "valve2Status", "automaticMode", "valveStaggering"):        
-        if isinstance(value, str):
-            return value.lower() in ["true", "1", "yes"]
-        return bool(value)
-    elif statetype in ("solarVoltage"):
-        try:
-            return float(value)
-        except (ValueError, TypeError):
-            return None
-    elif statetype in ("moisture", "brightness", "temperature", "duration"):
-        try:
-            return int(value)
-        except (ValueError, TypeError):
-            return None
-    else:
-        return value
\ No newline at end of file
+    converter = STATETYPE_CONVERTERS.get(statetype)
+    return value if converter is None else converter(value)
@@ -1,80 +1,350 @@
 import asyncio
+import itertools
 import json
 import logging
+import random
+import time
 import websockets
+from .utils import json_loads, notification_key
+from .metrics import LinkMetrics
+from .receive_queue import ReceiveQueue, OVERFLOW_COALESCE
+from .command_queue import CommandQueue, OutboundCommand
 
 _LOGGER = logging.getLogger(__name__)
 
+class WSCommandError(Exception):
+    """Raised when the cube rejects a command or does not answer in time."""
+
+class WSNotConnectedError(WSCommandError):
+    """Raised when a command cannot be sent because the websocket is not connected."""
+
+class ReconnectPolicy:
+    """Reconnect delays: immediate first retry, then exponential backoff with jitter up to a cap."""
+
+    def __init__(self, base_delay=1.0, max_delay=300.0, stable_after=60.0):
+        """
+        Parameters:
+            base_delay: Delay in seconds before the second retry, doubled for every further retry
+            max_delay: Upper bound for the delay in seconds
+            stable_after: Seconds a connection must stay up before the backoff is reset
+        """
+        self._base_delay    = base_delay
+        self._max_delay     = max_delay
+        self._stable_after  = stable_after
+        self.attempt        = 0
+        self.next_retry     = None
+        self.last_error     = None
+        self._connected_at  = None
+
+    def connected(self):
+        """Remember when the connection came up."""
+        self._connected_at = time.monotonic()
+        self.next_retry = None
+
+    def disconnected(self, error=None):
+        """Reset the backoff if the connection that just ended was stable."""
+        if error is not None:
+            self.last_error = str(error) or type(error).__name__
+        if self._connected_at is not None and time.monotonic() - self._connected_at >= self._stable_after:
+            self.attempt = 0
+        self._connected_at = None
+
+    def next_delay(self) -> float:
+        """Return the delay before the next connection attempt."""
+        self.attempt += 1
+        if self.attempt == 1:
+            delay = 0.0
+        else:
+            delay = min(self._max_delay, self._base_delay * 2 ** (self.attempt - 2))
+            # Equal jitter, keeps at least half of the delay
+            delay = delay / 2 + random.uniform(0, delay / 2)
+        self.next_retry = time.time() + delay
+        return delay
+
+    @property
+    def state(self) -> dict:
+        """Reconnect state for monitoring."""
+        return {
+            "attempt": self.attempt,
+            "next_retry": self.next_retry,
+            "last_error": self.last_error,
+        }
+
 class WSClient:
-    def __init__(self, url, on_message, api_key, reconnect_interval=15, timeout=60):
+    def __init__(self, url, on_message, api_key, ping_interval=20, pong_timeout=10, command_timeout=10, command_ttl=60, on_connect=None, reconnect_policy=None, metrics=None,
+                 queue_size=1000, overflow_policy=OVERFLOW_COALESCE, trace=None):
         self._url = url
+        self.metrics = metrics or LinkMetrics()
         self._on_message = on_message
+        self._on_connect = on_connect
         self._api_key = api_key
-        self._reconnect_interval = reconnect_interval
-        self._timeout = timeout
+        self._reconnect_policy = reconnect_policy or ReconnectPolicy()
+        self._ping_interval = ping_interval
+        self._pong_timeout = pong_timeout
+        self._close_reason = None
+        # MessageTrace recording the frames as received, before they are decoded, queued or dropped
+        self._trace = trace
+        self._command_timeout = command_timeout
+        self._command_ttl = command_ttl
         self._ws = None
         self._task = None
         self._stop_event = asyncio.Event()
+        self._request_ids = itertools.count(1)
+        self._pending = {}
+        self._connect_task = None
+        # Notifications are handed to a separate task so a slow dispatch never stalls recv()
+        self._queue = ReceiveQueue(queue_size, overflow_policy, notification_key, self.metrics)
+        self._consumer_task = None
+        # Commands wait here while the socket is down and go out as soon as it is back
+        self._commands = CommandQueue(self.metrics)
+        # Tasks of the commands sent and waiting for their response
+        self._transmits = set()
 
     async def start(self):
         """Starts the background connection task."""
         self._stop_event.clear()
+        self._consumer_task = asyncio.create_task(self._consume())
         self._task = asyncio.create_task(self._runner())
 
     async def stop(self):
         """Stops and disconnects."""
         self._stop_event.set()
+        if self._connect_task:
+            self._connect_task.cancel()
         if self._ws:
             await self._ws.close()
         if self._task:
             await self._task
+        if self._consumer_task:
+            self._consumer_task.cancel()
+        for task in list(self._transmits):
+            task.cancel()
+        if self._transmits:
+            await asyncio.gather(*self._transmits, return_exceptions=True)
+        self._queue.clear()
+        for command in self._commands.clear():
+            self._fail_command(command, WSNotConnectedError("WebSocket client stopped"))
 
-    async def send(self, data: dict):
-        """Sends data through the websocket."""
-        if self._ws:
-            try:
-                data["id"] = 1
-                data["apiKey"] = self._api_key                
-                await self._ws.send(json.dumps(data))
-            except Exception as e:
-                _LOGGER.error("WS send error: %s", e)
+    @property
+    def connected(self) -> bool:
+        return self._ws is not None
+
+    @property
+    def reconnect_state(self) -> dict:
+        """Attempt count, next retry time and last error of the reconnect loop."""
+        return dict(self._reconnect_policy.state, connected=self.connected)
+
+    async def send(self, data: dict, ttl=None, priority=False, idempotent=True):
+        """Queue a command and return the params of the cube's response, waiting for a reconnect if the socket is down.
+
+        Parameters:
+            data: Method and params of the command
+            ttl: Seconds the command may wait for the connection before it expires
+            priority: Send before all other commands and replace queued commands of the same method and circuit
+            idempotent: Whether the command may be sent again after the connection dropped before its response
+        """
+        loop = asyncio.get_running_loop()
+        command = OutboundCommand(data, loop.create_future(), data.get("params", {}).get("circuitId"), priority, idempotent)
+        if priority:
+            for superseded in self._commands.superseded(command):
+                self._fail_command(superseded, WSCommandError(f"Superseded by {data.get('method')}"))
+        command.expiry = loop.call_later(ttl or self._command_ttl, self._expire_command, command)
+        self._commands.put(command)
+        try:
+            return await command.future
+        finally:
+            command.expiry.cancel()
+
+    def _expire_command(self, command: OutboundCommand):
+        if command.future.done():
+            return
+        self.metrics.commands_expired += 1
+        self._commands.remove(command)
+        command.future.set_exception(WSCommandError(f"{command.data.get('method')} expired before the cube was reachable"))
+
+    def _fail_command(self, command: OutboundCommand, error: Exception):
+        if not command.future.done():
+            command.future.set_exception(error)
+
+    async def _send_commands(self, ws):
+        """Send queued commands while connected, each one in its own task waiting for the response."""
+        while True:
+            command = self._commands.next_ready()
+            if command is None:
+                self._commands.event.clear()
+                await self._commands.event.wait()
+                continue
+            task = asyncio.create_task(self._transmit(ws, command))
+            self._transmits.add(task)
+            task.add_done_callback(self._transmits.discard)
+
+    async def _transmit(self, ws, command: OutboundCommand):
+        request_id = next(self._request_ids)
+        message = dict(command.data, id=request_id, apiKey=self._api_key)
+        response = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = response
+        try:
+            await ws.send(json.dumps(message))
+            command.sent = True
+            sent_at = time.perf_counter()
+            result = await asyncio.wait_for(response, self._command_timeout)
+            self.metrics.command_rtt.add((time.perf_counter() - sent_at) * 1000)
+            if not command.future.done():
+                command.future.set_result(result)
+        except asyncio.TimeoutError:
+            self._fail_command(command, WSCommandError(f"No response to {command.data.get('method')} (id {request_id})"))
+        except WSCommandError as e:
+            if isinstance(e, WSNotConnectedError) and (command.idempotent or not command.sent):
+                self._retry_command(command)
+            else:
+                self._fail_command(command, e)
+        except asyncio.CancelledError:
+            self._fail_command(command, WSNotConnectedError("WebSocket client stopped"))
+            raise
+        except Exception as e:
+            # The connection dropped while sending
+            _LOGGER.debug("WS send of %s failed: %s", command.data.get("method"), e)
+            self._retry_command(command)
+        finally:
+            self._pending.pop(request_id, None)
+            self._commands.release(command)
+
+    def _retry_command(self, command: OutboundCommand):
+        """Put a command back in front of the queue, it goes out again after the reconnect."""
+        if command.future.done():
+            return
+        if self._stop_event.is_set():
+            # No reconnect will come, the caller must not wait for the TTL
+            self._fail_command(command, WSNotConnectedError("WebSocket client stopped"))
+            return
+        self.metrics.commands_retried += 1
+        command.sent = False
+        self._commands.put(command, front=True)
+
+    def _resolve_response(self, data: dict):
+        """Complete the pending command matching the id of a response."""
+        future = self._pending.get(data.get("id"))
+        if future is None or future.done():
+            _LOGGER.debug("Unmatched WS response: %s", data)
+            return
+
+        if data.get("status", "success") != "success":
+            future.set_exception(WSCommandError(data.get("error") or f"Command failed with status {data.get('status')}"))
+        else:
+            future.set_result(data.get("params", {}))
+
+    def _fail_pending(self, reason: str):
+        """Fail all commands still waiting for a response."""
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(WSNotConnectedError(reason))
 
     async def _runner(self):
         """Main loop connecting and reconnecting."""
         while not self._stop_event.is_set():
             try:
                 _LOGGER.info("Connecting to WebSocket: %s", self._url)
-                async with websockets.connect(self._url) as ws:
+                # Keepalive is done by _keepalive, which also measures the round trip time
+                async with websockets.connect(self._url, ping_interval=None) as ws:
                     self._ws = ws
+                    self._close_reason = None
+                    self._reconnect_policy.connected()
+                    self.metrics.connected()
                     _LOGGER.info("WebSocket connected")
-                    await self._listen()
+                    if self._on_connect:
+                        # Run alongside _listen, the callback may send commands and wait for responses
+                        self._connect_task = asyncio.create_task(self._on_connect())
+                    keepalive_task = asyncio.create_task(self._keepalive(ws))
+                    sender_task = asyncio.create_task(self._send_commands(ws))
+                    try:
+                        await self._listen()
+                    finally:
+                        keepalive_task.cancel()
+                        sender_task.cancel()
             except Exception as e:
                 _LOGGER.error("WS connection error: %s", e)
+                self._reconnect_policy.disconnected(e)
+            else:
+                self._reconnect_policy.disconnected()
+            finally:
+                self._ws = None
+                self.metrics.disconnected()
+                self._fail_pending("WebSocket disconnected")
+                # The resync after reconnecting supersedes whatever is still queued
+                self._queue.clear()
 
             if not self._stop_event.is_set():
-                _LOGGER.warning("WS disconnected, retrying in %s seconds...", self._reconnect_interval)
-                await asyncio.sleep(self._reconnect_interval)
+                delay = self._reconnect_policy.next_delay()
+                _LOGGER.warning("WS disconnected, retrying in %.1f seconds (attempt %s)...", delay, self._reconnect_policy.attempt)
+                try:
+                    await asyncio.wait_for(self._stop_event.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _keepalive(self, ws):
+        """Ping the cube periodically and drop the connection as soon as a pong is missed."""
+        while True:
+            await asyncio.sleep(self._ping_interval)
+            try:
+                sent_at = time.perf_counter()
+                pong_waiter = await ws.ping()
+                await asyncio.wait_for(pong_waiter, self._pong_timeout)
+            except asyncio.TimeoutError:
+                self.metrics.missed_pongs += 1
+                self._close_reason = f"No pong within {self._pong_timeout}s"
+                _LOGGER.warning("No pong from %s within %ss, reconnecting", self._url, self._pong_timeout)
+                # A half-open connection would also stall the closing handshake
+                ws.transport.abort()
+                return
+            except Exception:
+                # Connection already closed, _listen notices it as well
+                return
+            self.metrics.ping_rtt.add((time.perf_counter() - sent_at) * 1000)
 
     async def _listen(self):
-        """Listen for incoming messages with a timeout."""
+        """Listen for incoming messages until the connection closes."""
         while not self._stop_event.is_set():
             try:
-                msg = await asyncio.wait_for(self._ws.recv(), timeout=self._timeout)
-            except asyncio.TimeoutError:
-                _LOGGER.warning("WS timeout, sending ping")
-                try:
-                    await self._ws.ping()
-                except:
-                    break
-                continue
+                msg = await self._ws.recv()
+            except websockets.exceptions.ConnectionClosedOK as e:
+                # Closing handshake completed, e.g. by stop() or a cube shutting down cleanly
+                _LOGGER.debug("WS connection closed: %s", e)
+                self._reconnect_policy.last_error = self._close_reason or str(e) or type(e).__name__
+                break
             except Exception as e:
                 _LOGGER.error("WS listen error: %s", e)
+                self._reconnect_policy.last_error = self._close_reason or str(e) or type(e).__name__
                 break
 
+            self.metrics.message_received()
+            if self._trace is not None:
+                self._trace.record(msg)
             try:
-                data = json.loads(msg)
+                data = json_loads(msg)
             except:
+                self.metrics.malformed_frames += 1
                 _LOGGER.error("Bad WS message: %s", msg)
                 continue
 
-            await self._on_message(data)
+            if not isinstance(data, dict):
+                _LOGGER.debug("Ignoring non-object WS message: %s", msg)
+                continue
+
+            # Responses carry the id of the command, notifications do not
+            if "id" in data and "notification" not in data:
+                self._resolve_response(data)
+                continue
+
+            self._queue.put(data)
+
+    async def _consume(self):
+        """Hand queued notifications to the message callback, one at a time."""
+        while True:
+            data = await self._queue.get()
+            try:
+                await self._on_message(data)
+            except Exception:
+                _LOGGER.exception("Error handling WS message: %s", data)
+            # Let the reader run between messages while draining a backlog
+            await asyncio.sleep(0)
+
@@ -0,0 +1,11 @@
+"""Make the Home Assistant independent modules of the integration importable as the miyocube package."""
+import os
+import sys
+import types
+
+COMPONENT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "custom_components", "miyocube")
+
+# The package __init__ needs Home Assistant, the modules under test do not
+package = types.ModuleType("miyocube")
+package.__path__ = [COMPONENT_DIR]
+sys.modules.setdefault("miyocube", package)
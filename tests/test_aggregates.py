@@ -0,0 +1,100 @@
+import random
+
+import pytest
+
+from miyocube.aggregates import WINDOW_BUCKETS, RollingAggregates, RollingWindow, parse_windows
+
+def _reference(samples, window, now):
+    """Statistics of the held samples from the oldest bucket boundary still in the window to now, computed from scratch."""
+    span = window / WINDOW_BUCKETS
+    cutoff = (int(now // span) - WINDOW_BUCKETS + 1) * span
+    before = [sample for sample in samples if sample[0] <= cutoff]
+    inside = [sample for sample in samples if sample[0] > cutoff]
+    start_at = cutoff if before else inside[0][0]
+    points = ([(start_at, before[-1][1])] if before else []) + inside
+    values = [value for _, value in points]
+    if now <= start_at:
+        return min(values), max(values), points[-1][1], None
+    area = sum(points[i][1] * (points[i + 1][0] - points[i][0]) for i in range(len(points) - 1))
+    area += points[-1][1] * (now - points[-1][0])
+    rate = (points[-1][1] - points[0][1]) / (now - start_at) * 3600
+    return min(values), max(values), area / (now - start_at), rate
+
+@pytest.mark.parametrize("window", [10, 50, 100])
+def test_window_matches_reference(window):
+    rng = random.Random(window)
+    rolling = RollingWindow(window)
+    samples = []
+    now = 0
+    for _ in range(500):
+        now += rng.choice([0, 1, 3, 7, 20])
+        value = rng.randint(0, 50)
+        rolling.add(value, now)
+        samples.append((now, value))
+        now += rng.choice([0, 1, 5, 200])
+
+        expected = _reference(samples, window, now)
+        actual = tuple(rolling.value(stat, now) for stat in ("min", "max", "mean", "rate"))
+        assert actual[:2] == expected[:2]
+        assert actual[2] == pytest.approx(expected[2])
+        assert actual[3] == pytest.approx(expected[3])
+
+def test_window_keeps_the_last_value_when_it_does_not_change():
+    rolling = RollingWindow(100)
+    rolling.add(5, 0)
+    assert rolling.value("min", 1000) == 5
+    assert rolling.value("mean", 1000) == 5
+    assert rolling.value("rate", 1000) == 0
+
+def test_empty_window():
+    assert RollingWindow(100).value("mean", 0) is None
+
+def test_snapshot_restores_the_same_statistics():
+    rolling = RollingWindow(3600)
+    for timestamp, value in ((1000, 3), (1500, 9), (2000, 4)):
+        rolling.add(value, timestamp)
+    restored = RollingWindow(3600)
+    restored.restore(rolling.snapshot())
+    for stat in ("min", "max", "mean", "rate"):
+        assert restored.value(stat, 2500) == rolling.value(stat, 2500)
+
+def test_window_size_does_not_grow_with_the_update_rate():
+    rolling = RollingWindow(3600)
+    for timestamp in range(20000):
+        rolling.add(timestamp % 7, timestamp / 2)
+    assert len(rolling.snapshot()["buckets"]) <= WINDOW_BUCKETS + 1
+
+def test_restore_raw_samples():
+    restored = RollingWindow(3600)
+    restored.restore([[1000, 3], [1500, 9], [2000, 4]])
+    assert restored.value("max", 2500) == 9
+    assert restored.value("min", 2500) == 3
+
+def test_aggregates_share_one_subscription_per_state():
+    listeners = {}
+
+    def subscribe(device_id, state_type, listener):
+        listeners[(device_id, state_type)] = listener
+        return lambda: listeners.pop((device_id, state_type))
+
+    aggregates = RollingAggregates(subscribe)
+    day = aggregates.window("s1", "moisture", 24, 40)
+    week = aggregates.window("s1", "moisture", 168)
+    assert len(listeners) == 1
+
+    listeners[("s1", "moisture")](10)
+    listeners[("s1", "moisture")](None)
+    assert day.value("min") == week.value("min") == 10
+    assert day.value("max") == 40
+    assert set(aggregates.snapshot()) == {"s1|moisture|24", "s1|moisture|168"}
+
+    aggregates.discard("s1")
+    assert not listeners
+
+def test_parse_windows():
+    assert parse_windows(" 168, 24,,24") == (24, 168)
+    assert parse_windows("") == ()
+    with pytest.raises(ValueError):
+        parse_windows("0")
+    with pytest.raises(ValueError):
+        parse_windows("day")
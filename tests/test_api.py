@@ -0,0 +1,69 @@
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from miyocube.api import MiyoApiClient, MiyoApiError
+
+def _serve(responses, path="/api/System/status"):
+    """Run a test against a local server answering path with the given responses in turn."""
+    requests = []
+
+    async def handler(request):
+        requests.append(dict(request.query))
+        return responses[min(len(requests), len(responses)) - 1]()
+
+    async def run(test):
+        app = web.Application()
+        app.router.add_get(path, handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            async with aiohttp.ClientSession() as session:
+                return await test(MiyoApiClient(session, f"127.0.0.1:{port}", "secret", timeout=1, retries=2, backoff=0.01))
+        finally:
+            await runner.cleanup()
+
+    return requests, run
+
+STATUS = lambda: web.json_response({"params": {"uuid": "cube"}})
+
+def test_status_sends_the_api_key():
+    requests, run = _serve([STATUS])
+    assert asyncio.run(run(lambda client: client.async_get_status())) == {"uuid": "cube"}
+    assert requests == [{"apiKey": "secret"}]
+
+def test_server_errors_are_retried():
+    requests, run = _serve([lambda: web.Response(status=503), lambda: web.Response(status=500), STATUS])
+    assert asyncio.run(run(lambda client: client.async_get_status())) == {"uuid": "cube"}
+    assert len(requests) == 3
+
+def test_undecodable_body_ends_in_api_error_after_the_retries():
+    requests, run = _serve([lambda: web.Response(text="<html>rebooting</html>", content_type="text/html")])
+    with pytest.raises(MiyoApiError):
+        asyncio.run(run(lambda client: client.async_get_status()))
+    assert len(requests) == 3
+
+def test_client_errors_are_not_retried():
+    requests, run = _serve([lambda: web.Response(status=401)])
+    with pytest.raises(MiyoApiError, match="HTTP 401"):
+        asyncio.run(run(lambda client: client.async_get_status()))
+    assert len(requests) == 1
+
+def test_unreachable_cube_raises_api_error():
+    async def run():
+        async with aiohttp.ClientSession() as session:
+            # Nothing listens on port 9 of localhost
+            client = MiyoApiClient(session, "127.0.0.1:9", "secret", timeout=1, retries=1, backoff=0.01)
+            await client.async_get_status()
+    with pytest.raises(MiyoApiError):
+        asyncio.run(run())
+
+def test_circuits_with_unexpected_shape_raise_api_error():
+    requests, run = _serve([lambda: web.json_response({"params": {}})], path="/api/circuit/all")
+    with pytest.raises(MiyoApiError, match="parsing circuits"):
+        asyncio.run(run(lambda client: client.async_get_circuits()))
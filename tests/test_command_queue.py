@@ -0,0 +1,168 @@
+import asyncio
+import json
+
+import pytest
+
+from miyocube.command_queue import CommandQueue, OutboundCommand
+from miyocube.ws_client import WSClient, WSCommandError
+
+def _command(loop, method="Circuit.edit", key="c1", priority=False, idempotent=True):
+    return OutboundCommand({"method": method, "params": {"circuitId": key}}, loop.create_future(), key, priority, idempotent)
+
+def test_next_ready_holds_back_a_key_in_flight():
+    async def run():
+        loop = asyncio.get_running_loop()
+        queue = CommandQueue()
+        first, second, other = _command(loop), _command(loop), _command(loop, key="c2")
+        for command in (first, second, other):
+            queue.put(command)
+
+        assert queue.next_ready() is first
+        # c1 is in flight, the command of c2 may overtake the second one of c1
+        assert queue.next_ready() is other
+        assert queue.next_ready() is None
+        queue.release(first)
+        assert queue.next_ready() is second
+    asyncio.run(run())
+
+def test_next_ready_prefers_priority_and_skips_done():
+    async def run():
+        loop = asyncio.get_running_loop()
+        queue = CommandQueue()
+        cancelled, normal = _command(loop, key="c1"), _command(loop, key="c2")
+        urgent = _command(loop, method="Circuit.irrigation", key="c3", priority=True)
+        queue.put(cancelled)
+        queue.put(normal)
+        queue.put(urgent)
+        cancelled.future.cancel()
+
+        assert queue.next_ready() is urgent
+        assert queue.next_ready() is normal
+        assert queue.next_ready() is None
+        assert len(queue) == 0
+    asyncio.run(run())
+
+def test_superseded_removes_same_method_and_key_only():
+    async def run():
+        loop = asyncio.get_running_loop()
+        queue = CommandQueue()
+        start = _command(loop, method="Circuit.irrigation", key="c1")
+        edit = _command(loop, method="Circuit.edit", key="c1")
+        other = _command(loop, method="Circuit.irrigation", key="c2")
+        for command in (start, edit, other):
+            queue.put(command)
+
+        stop = _command(loop, method="Circuit.irrigation", key="c1", priority=True)
+        assert queue.superseded(stop) == [start]
+        assert len(queue) == 2
+    asyncio.run(run())
+
+class FakeSocket:
+    """Records sent frames and can fail like a dropped connection."""
+
+    def __init__(self, error=None):
+        self.sent   = []
+        self.error  = error
+
+    async def send(self, frame):
+        if self.error:
+            raise self.error
+        self.sent.append(json.loads(frame))
+
+async def _transmit(client, command, socket, outcome):
+    """Run _transmit for command and apply outcome once the frame went out."""
+    task = asyncio.create_task(client._transmit(socket, command))
+    await asyncio.sleep(0)
+    outcome()
+    await task
+
+def test_transmit_resolves_with_the_response_params():
+    async def run():
+        loop = asyncio.get_running_loop()
+        client = WSClient("ws://cube", None, "key")
+        command = _command(loop)
+        socket = FakeSocket()
+        await _transmit(client, command, socket, lambda: client._resolve_response({"id": socket.sent[0]["id"], "params": {"ok": True}}))
+
+        assert socket.sent[0]["apiKey"] == "key"
+        assert command.future.result() == {"ok": True}
+        assert not client._pending
+    asyncio.run(run())
+
+def test_transmit_retries_idempotent_command_after_disconnect():
+    async def run():
+        loop = asyncio.get_running_loop()
+        client = WSClient("ws://cube", None, "key")
+        command = _command(loop, idempotent=True)
+        await _transmit(client, command, FakeSocket(), lambda: client._fail_pending("gone"))
+
+        assert not command.future.done()
+        assert client.metrics.commands_retried == 1
+        assert client._commands.next_ready() is command
+        assert not command.sent
+    asyncio.run(run())
+
+def test_transmit_fails_sent_non_idempotent_command_after_disconnect():
+    async def run():
+        loop = asyncio.get_running_loop()
+        client = WSClient("ws://cube", None, "key")
+        command = _command(loop, idempotent=False)
+        await _transmit(client, command, FakeSocket(), lambda: client._fail_pending("gone"))
+
+        # It may have been executed, sending it again could start an irrigation twice
+        assert isinstance(command.future.exception(), WSCommandError)
+        assert client.metrics.commands_retried == 0
+        assert len(client._commands) == 0
+    asyncio.run(run())
+
+def test_transmit_retries_non_idempotent_command_that_was_not_sent():
+    async def run():
+        loop = asyncio.get_running_loop()
+        client = WSClient("ws://cube", None, "key")
+        command = _command(loop, idempotent=False)
+        await client._transmit(FakeSocket(ConnectionError("closed")), command)
+
+        assert not command.future.done()
+        assert client._commands.next_ready() is command
+    asyncio.run(run())
+
+def test_transmit_fails_rejected_command():
+    async def run():
+        loop = asyncio.get_running_loop()
+        client = WSClient("ws://cube", None, "key")
+        command = _command(loop)
+        socket = FakeSocket()
+        await _transmit(client, command, socket, lambda: client._resolve_response({"id": socket.sent[0]["id"], "status": "error", "error": "nope"}))
+
+        assert str(command.future.exception()) == "nope"
+        assert len(client._commands) == 0
+    asyncio.run(run())
+
+def test_disconnect_during_stop_fails_instead_of_retrying():
+    async def run():
+        loop = asyncio.get_running_loop()
+        client = WSClient("ws://cube", None, "key")
+        command = _command(loop, idempotent=True)
+        client._stop_event.set()
+        await _transmit(client, command, FakeSocket(), lambda: client._fail_pending("gone"))
+
+        assert isinstance(command.future.exception(), WSCommandError)
+        assert len(client._commands) == 0
+    asyncio.run(run())
+
+def test_stop_fails_commands_waiting_for_their_response():
+    async def run():
+        client = WSClient("ws://cube", None, "key", command_ttl=60)
+        socket = FakeSocket()
+        sender = asyncio.create_task(client._send_commands(socket))
+        caller = asyncio.create_task(client.send({"method": "Circuit.edit", "params": {"circuitId": "c1"}}))
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert len(socket.sent) == 1
+
+        await asyncio.wait_for(client.stop(), 1)
+        sender.cancel()
+        with pytest.raises(WSCommandError, match="stopped"):
+            await asyncio.wait_for(caller, 1)
+        assert not client._transmits
+    asyncio.run(run())
@@ -0,0 +1,93 @@
+import asyncio
+
+from miyocube.dispatcher import MiyoDispatcher, UpdateCoalescer
+from miyocube.state_store import MiyoStateStore
+
+def _update(device_id, state_type, value):
+    return {"device_id": device_id, "state_type": state_type, "value": value}
+
+def test_updates_reach_only_the_listeners_of_their_state():
+    dispatcher = MiyoDispatcher(MiyoStateStore())
+    moisture, temperature = [], []
+    dispatcher.subscribe("s1", "moisture", moisture.append)
+    dispatcher.subscribe("s1", "temperature", temperature.append)
+
+    dispatcher.dispatch([_update("s1", "moisture", 40), _update("s2", "moisture", 50)])
+    assert moisture == [40]
+    assert temperature == []
+
+def test_unchanged_values_are_not_dispatched():
+    store = MiyoStateStore()
+    dispatcher = MiyoDispatcher(store)
+    received = []
+    dispatcher.subscribe("s1", "moisture", received.append)
+
+    dispatcher.dispatch([_update("s1", "moisture", 40)])
+    dispatcher.dispatch([_update("s1", "moisture", 40)])
+    dispatcher.dispatch([_update("s1", "moisture", 41)])
+    assert received == [40, 41]
+    assert store.get("s1", "moisture") == 41
+
+def test_seed_stores_without_notifying_and_diff_keeps_changes():
+    dispatcher = MiyoDispatcher(MiyoStateStore())
+    received = []
+    dispatcher.subscribe("s1", "moisture", received.append)
+    dispatcher.seed([_update("s1", "moisture", 40)])
+
+    assert received == []
+    assert dispatcher.diff([_update("s1", "moisture", 40), _update("s1", "temperature", 20)]) == [_update("s1", "temperature", 20)]
+
+def test_listener_may_unsubscribe_while_called_and_errors_are_isolated():
+    dispatcher = MiyoDispatcher(MiyoStateStore())
+    received = []
+
+    def once(value):
+        received.append(value)
+        unsubscribe()
+
+    def broken(value):
+        raise RuntimeError("listener failed")
+
+    unsubscribe = dispatcher.subscribe("s1", "moisture", once)
+    dispatcher.subscribe("s1", "moisture", broken)
+    dispatcher.subscribe("s1", "moisture", received.append)
+
+    dispatcher.dispatch([_update("s1", "moisture", 1)])
+    dispatcher.dispatch([_update("s1", "moisture", 2)])
+    assert received == [1, 1, 2]
+
+def test_updates_without_device_or_state_type_are_skipped():
+    store = MiyoStateStore()
+    MiyoDispatcher(store).dispatch([{"state_type": "moisture", "value": 1}, {"device_id": "s1", "value": 1}])
+    assert len(store) == 0
+
+def test_coalescer_without_window_dispatches_right_away():
+    async def run():
+        batches = []
+        coalescer = UpdateCoalescer(asyncio.get_running_loop(), batches.append, 0)
+        coalescer.add([_update("s1", "moisture", 1)])
+        return batches
+    assert asyncio.run(run()) == [[_update("s1", "moisture", 1)]]
+
+def test_coalescer_merges_a_burst_into_one_batch_keeping_the_last_value():
+    async def run():
+        batches = []
+        coalescer = UpdateCoalescer(asyncio.get_running_loop(), batches.append, 10)
+        coalescer.add([_update("s1", "moisture", 1), _update("s1", "temperature", 20)])
+        coalescer.add([_update("s1", "moisture", 2)])
+        assert batches == []
+        await asyncio.sleep(0.05)
+        return batches
+    assert asyncio.run(run()) == [[_update("s1", "moisture", 2), _update("s1", "temperature", 20)]]
+
+def test_coalescer_flush_and_cancel():
+    async def run():
+        batches = []
+        coalescer = UpdateCoalescer(asyncio.get_running_loop(), batches.append, 10)
+        coalescer.add([_update("s1", "moisture", 1)])
+        coalescer.flush()
+        coalescer.add([_update("s1", "moisture", 2)])
+        coalescer.cancel()
+        await asyncio.sleep(0.05)
+        return batches
+    assert asyncio.run(run()) == [[_update("s1", "moisture", 1)]]
@@ -0,0 +1,56 @@
+import asyncio
+
+from miyocube.edit_batcher import CircuitEditBatcher
+
+def test_edits_within_the_window_are_merged():
+    async def run():
+        sent = []
+
+        async def send(command):
+            sent.append(command)
+            return {}
+
+        batcher = CircuitEditBatcher(asyncio.get_running_loop(), send, window_ms=10)
+        results = await asyncio.gather(
+            batcher.edit("c1", {"automaticMode": True}),
+            batcher.edit("c1", {"valveStaggering": True}),
+            batcher.edit("c1", {"automaticMode": False}),
+            batcher.edit("c2", {"automaticMode": True}),
+        )
+        return sent, results
+
+    sent, results = asyncio.run(run())
+    assert sent == [
+        {"method": "Circuit.edit", "params": {"circuitId": "c1", "automaticMode": False, "state_type": "automaticMode"}},
+        {"method": "Circuit.edit", "params": {"circuitId": "c1", "valveStaggering": True, "state_type": "valveStaggering"}},
+        {"method": "Circuit.edit", "params": {"circuitId": "c2", "automaticMode": True, "state_type": "automaticMode"}},
+    ]
+    assert results[0] == results[2] == {"automaticMode": False, "valveStaggering": True}
+
+def test_failed_edit_reaches_every_caller():
+    async def run():
+        async def send(command):
+            raise ConnectionError("down")
+
+        batcher = CircuitEditBatcher(asyncio.get_running_loop(), send, window_ms=0)
+        return await asyncio.gather(batcher.edit("c1", {"a": 1}), batcher.edit("c1", {"b": 2}), return_exceptions=True)
+
+    assert all(isinstance(result, ConnectionError) for result in asyncio.run(run()))
+
+def test_cancel_fails_edits_being_sent():
+    async def run():
+        async def send(command):
+            await asyncio.sleep(10)
+
+        batcher = CircuitEditBatcher(asyncio.get_running_loop(), send, window_ms=0)
+        edit = asyncio.ensure_future(batcher.edit("c1", {"a": 1}))
+        for _ in range(3):
+            await asyncio.sleep(0)
+        batcher.cancel()
+        result = await asyncio.gather(edit, return_exceptions=True)
+        await asyncio.sleep(0)
+        return result[0], batcher._sending
+
+    result, sending = asyncio.run(run())
+    assert isinstance(result, asyncio.CancelledError)
+    assert not sending
@@ -0,0 +1,72 @@
+import asyncio
+
+from miyocube.metrics import LinkMetrics
+from miyocube.receive_queue import ReceiveQueue, OVERFLOW_COALESCE, OVERFLOW_DROP_OLDEST
+
+def _key(data):
+    return data.get("key")
+
+def _drain(queue):
+    async def run():
+        return [await queue.get() for _ in range(len(queue))]
+    return asyncio.run(run())
+
+def test_coalesce_keeps_position_and_newest_value():
+    metrics = LinkMetrics()
+    queue = ReceiveQueue(2, OVERFLOW_COALESCE, _key, metrics)
+    queue.put({"key": "a", "value": 1})
+    queue.put({"key": "b", "value": 1})
+    queue.put({"key": "a", "value": 2})
+
+    assert _drain(queue) == [{"key": "a", "value": 2}, {"key": "b", "value": 1}]
+    assert metrics.coalesced_frames == 1
+
+def test_nothing_is_coalesced_below_the_size():
+    metrics = LinkMetrics()
+    queue = ReceiveQueue(10, OVERFLOW_COALESCE, _key, metrics)
+    queue.put({"key": "a", "value": 1})
+    queue.put({"key": "b", "value": 1})
+    queue.put({"key": "a", "value": 2})
+
+    assert _drain(queue) == [{"key": "a", "value": 1}, {"key": "b", "value": 1}, {"key": "a", "value": 2}]
+    assert metrics.coalesced_frames == 0
+
+def test_full_queue_coalesces_into_the_newest_message_of_a_key():
+    queue = ReceiveQueue(3, OVERFLOW_COALESCE, _key)
+    queue.put({"key": "a", "value": 1})
+    queue.put({"key": "b", "value": 1})
+    queue.put({"key": "a", "value": 2})
+    queue.put({"key": "a", "value": 3})
+
+    assert _drain(queue) == [{"key": "a", "value": 1}, {"key": "b", "value": 1}, {"key": "a", "value": 3}]
+
+def test_overflow_drops_oldest_telemetry_but_never_unkeyed():
+    metrics = LinkMetrics()
+    queue = ReceiveQueue(3, OVERFLOW_DROP_OLDEST, _key, metrics)
+    queue.put({"circuit": 1})
+    queue.put({"key": "a", "value": 1})
+    queue.put({"key": "a", "value": 2})
+    queue.put({"key": "b", "value": 1})
+
+    assert _drain(queue) == [{"circuit": 1}, {"key": "a", "value": 2}, {"key": "b", "value": 1}]
+    assert metrics.dropped_frames == 1
+
+def test_unkeyed_messages_may_exceed_the_size():
+    metrics = LinkMetrics()
+    queue = ReceiveQueue(2, OVERFLOW_COALESCE, _key, metrics)
+    for i in range(4):
+        queue.put({"circuit": i})
+
+    assert len(queue) == 4
+    assert metrics.dropped_frames == 0
+    assert metrics.queue_high_water == 4
+
+def test_get_waits_for_put():
+    async def run():
+        queue = ReceiveQueue(10, OVERFLOW_COALESCE, _key)
+        getter = asyncio.create_task(queue.get())
+        await asyncio.sleep(0)
+        assert not getter.done()
+        queue.put({"key": "a"})
+        return await asyncio.wait_for(getter, 1)
+    assert asyncio.run(run()) == {"key": "a"}
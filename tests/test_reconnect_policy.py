@@ -0,0 +1,38 @@
+import pytest
+
+from miyocube import ws_client
+from miyocube.ws_client import ReconnectPolicy
+
+def test_first_retry_is_immediate_then_backs_off_with_jitter():
+    policy = ReconnectPolicy(base_delay=1.0, max_delay=8.0)
+    assert policy.next_delay() == 0.0
+    for attempt, full in ((2, 1.0), (3, 2.0), (4, 4.0), (5, 8.0), (6, 8.0), (7, 8.0)):
+        delay = policy.next_delay()
+        assert policy.attempt == attempt
+        # Equal jitter keeps at least half of the delay
+        assert full / 2 <= delay <= full
+
+def test_backoff_resets_only_after_a_stable_connection(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ws_client.time, "monotonic", lambda: now[0])
+    policy = ReconnectPolicy(base_delay=1.0, stable_after=60.0)
+    for _ in range(3):
+        policy.next_delay()
+
+    policy.connected()
+    now[0] += 10
+    policy.disconnected(ConnectionError("flapping"))
+    assert policy.attempt == 3
+    assert policy.state["last_error"] == "flapping"
+
+    policy.connected()
+    now[0] += 60
+    policy.disconnected()
+    assert policy.attempt == 0
+    assert policy.next_delay() == 0.0
+
+@pytest.mark.parametrize("error, expected", [(TimeoutError(), "TimeoutError"), (OSError("refused"), "refused")])
+def test_last_error_falls_back_to_the_type(error, expected):
+    policy = ReconnectPolicy()
+    policy.disconnected(error)
+    assert policy.last_error == expected
@@ -0,0 +1,98 @@
+import asyncio
+
+from miyocube.scheduler import IrrigationScheduler
+
+class Cube:
+    """Records starts and stops and lets a test end an irrigation like the cube would."""
+
+    def __init__(self):
+        self.started    = []
+        self.stopped    = []
+        self.listeners  = {}
+
+    async def start(self, circuit_id, duration):
+        self.started.append(circuit_id)
+
+    async def stop(self, circuit_id):
+        self.stopped.append(circuit_id)
+
+    def subscribe(self, circuit_id, state_type, listener):
+        self.listeners[circuit_id] = listener
+        return lambda: self.listeners.pop(circuit_id, None)
+
+    def end(self, circuit_id):
+        self.listeners[circuit_id](False)
+
+async def _settle():
+    """Let the irrigation tasks run until they wait again."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def _scheduler(cube):
+    return IrrigationScheduler(cube.start, cube.stop, cube.subscribe, lambda coro, circuit_id: asyncio.get_running_loop().create_task(coro))
+
+def test_plan_runs_within_the_limit_and_chains():
+    async def run():
+        cube = Cube()
+        scheduler = _scheduler(cube)
+        scheduler.start_plan([("a", 5), ("b", 5), ("c", 5)], 2)
+        await _settle()
+        assert cube.started == ["a", "b"]
+        assert scheduler.state["pending"] == ["c"]
+
+        cube.end("a")
+        await _settle()
+        assert cube.started == ["a", "b", "c"]
+        await scheduler.async_stop()
+        await _settle()
+        assert sorted(cube.stopped) == ["b", "c"]
+    asyncio.run(run())
+
+def test_circuit_listed_twice_runs_after_itself():
+    async def run():
+        cube = Cube()
+        scheduler = _scheduler(cube)
+        scheduler.start_plan([("a", 5), ("a", 5), ("b", 5)], 3)
+        await _settle()
+        assert cube.started == ["a", "b"]
+        assert scheduler.state["pending"] == ["a"]
+
+        cube.end("a")
+        await _settle()
+        assert cube.started == ["a", "b", "a"]
+        assert sorted(scheduler.state["running"]) == ["a", "b"]
+        scheduler.cancel()
+        await _settle()
+    asyncio.run(run())
+
+def test_stop_of_one_circuit_removes_it_from_the_plan():
+    async def run():
+        cube = Cube()
+        scheduler = _scheduler(cube)
+        scheduler.start_plan([("a", 5), ("b", 5)], 1)
+        await _settle()
+        await scheduler.async_stop(["b"])
+        assert scheduler.state["pending"] == []
+        assert cube.stopped == ["b"]
+        assert scheduler.state["running"] == ["a"]
+        scheduler.cancel()
+        await _settle()
+    asyncio.run(run())
+
+def test_new_plan_defers_a_circuit_still_irrigating():
+    async def run():
+        cube = Cube()
+        scheduler = _scheduler(cube)
+        scheduler.start_plan([("a", 5)], 2)
+        await _settle()
+        scheduler.start_plan([("a", 5), ("b", 5)], 2)
+        await _settle()
+        assert cube.started == ["a", "b"]
+        assert scheduler.state["pending"] == ["a"]
+
+        cube.end("a")
+        await _settle()
+        assert cube.started == ["a", "b", "a"]
+        scheduler.cancel()
+        await _settle()
+    asyncio.run(run())
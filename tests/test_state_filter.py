@@ -0,0 +1,26 @@
+from miyocube.state_filter import Hysteresis, StateFilter
+
+def test_changes_within_the_deadband_are_skipped():
+    hysteresis = Hysteresis(absolute=0.5)
+    assert hysteresis.write_delay(10.0, 0, 10.4, 5) is None
+    assert hysteresis.write_delay(10.0, 0, 10.6, 5) == 0
+
+def test_relative_deadband():
+    hysteresis = Hysteresis(relative=0.05)
+    assert hysteresis.write_delay(1000, 0, 1040, 5) is None
+    assert hysteresis.write_delay(1000, 0, 1060, 5) == 0
+
+def test_min_interval_delays_the_write():
+    hysteresis = Hysteresis(min_interval=10)
+    assert hysteresis.write_delay(1, 0, 2, 4) == 6
+
+def test_heartbeat_schedules_a_change_within_the_deadband():
+    hysteresis = Hysteresis(absolute=1, heartbeat=100)
+    assert hysteresis.write_delay(5, 0, 5.5, 30) == 70
+    assert hysteresis.write_delay(5, 0, 5.5, 150) == 0
+    assert hysteresis.write_delay(5, 0, 5, 150) is None
+
+def test_defaults_write_every_change():
+    state_filter = StateFilter.from_options({})
+    for state_type in ("brightness", "solarVoltage", "temperature", "moisture"):
+        assert state_filter.get(state_type).write_delay(1.0, 0, 1.01, 1) == 0
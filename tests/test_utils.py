@@ -0,0 +1,86 @@
+import datetime
+
+from miyocube.utils import circuit_updates, notification_key, parse_circuits, parse_ws_payload, topology_changes, topology_ids
+
+def test_device_state_changed_is_converted():
+    updates = parse_ws_payload({"notification": "Device.stateChanged", "params": {"deviceId": "{s1}", "type": "moisture", "value": "42"}})
+    assert updates == [{"device_id": "s1", "state_type": "moisture", "value": 42}]
+
+def test_device_updated_reports_the_last_update():
+    updates = parse_ws_payload({"notification": "Device.updated", "params": {"id": "{v1}", "lastUpdate": 1700000000}})
+    assert updates == [{"device_id": "v1", "state_type": "lastUpdate", "value": datetime.datetime.fromtimestamp(1700000000, tz=datetime.timezone.utc)}]
+
+def test_circuit_state_changed_is_converted():
+    updates = parse_ws_payload({"notification": "Circuit.stateChanged", "params": {"circuitId": "{c1}", "type": "irrigationWasStarted", "value": "true"}})
+    assert updates == [{"device_id": "c1", "state_type": "irrigationWasStarted", "value": True}]
+
+def test_params_only_circuit_edited():
+    updates = parse_ws_payload({"notification": "Circuit.edited", "params": {"circuit": {"id": "{c1}", "params": {"automaticMode": False, "valveStaggering": True}}}})
+    assert updates == [
+        {"device_id": "c1", "state_type": "automaticMode", "value": False},
+        {"device_id": "c1", "state_type": "valveStaggering", "value": True},
+    ]
+
+def test_unknown_notifications_are_dropped():
+    assert parse_ws_payload({"notification": "System.somethingElse", "params": {}}) == []
+    assert parse_ws_payload({"id": 3, "params": {}}) == []
+
+def test_only_telemetry_has_a_coalescing_key():
+    assert notification_key({"notification": "Device.stateChanged", "params": {"deviceId": "s1", "type": "moisture"}}) == ("Device.stateChanged", "s1", "moisture")
+    assert notification_key({"notification": "Device.updated", "params": {"id": "s1"}}) == ("Device.updated", "s1")
+    assert notification_key({"notification": "Circuit.stateChanged", "params": {"circuitId": "c1"}}) is None
+
+CIRCUITS = {"params": {"circuits": {
+    "{c1}": {
+        "name": "Lawn",
+        "stateTypes": {"a": {"type": "irrigationWasStarted", "value": False}},
+        "params": {"automaticMode": True},
+        "sensorData": {"id": "s1", "ipv6": "fe80::1", "lastUpdate": 1700000000, "stateTypes": {"b": {"type": "moisture", "value": 40}}},
+        "valves": {"{v1}": {"channel": 1, "valveData": {"id": "v1", "ipv6": "fe80::2", "stateTypes": {"c": {"type": "valveStatus", "value": "false"}}}}},
+    },
+}}}
+
+def test_parse_circuits_and_flatten_to_updates():
+    circuits = parse_circuits(CIRCUITS)
+    assert circuits[0]["id"] == "c1"
+    assert circuits[0]["sensor"]["id"] == "s1"
+    assert [valve["id"] for valve in circuits[0]["valves"]] == ["v1"]
+
+    updates = {(update["device_id"], update["state_type"]): update["value"] for update in circuit_updates(circuits)}
+    assert updates[("c1", "irrigationWasStarted")] is False
+    assert updates[("c1", "automaticMode")] is True
+    assert updates[("s1", "moisture")] == 40
+    assert updates[("s1", "circuitName")] == "Lawn"
+    assert updates[("v1", "valveStatus")] is False
+
+def test_full_circuit_edited_yields_the_same_updates_as_the_api():
+    circuit = CIRCUITS["params"]["circuits"]["{c1}"]
+    updates = parse_ws_payload({"notification": "Circuit.edited", "params": {"circuit": dict(circuit, id="{c1}")}})
+    assert updates == circuit_updates(parse_circuits(CIRCUITS))
+
+def _circuit(circuit_id, sensor_id=None, valve_ids=()):
+    return {"id": circuit_id, "sensor": {"id": sensor_id}, "valves": [{"id": valve_id} for valve_id in valve_ids]}
+
+def test_unchanged_topology_has_nothing_to_add_or_remove():
+    circuits = [_circuit("c1", "s1", ["v1"]), _circuit("c2", None, ["v2"])]
+    assert topology_changes(circuits, [dict(circuit) for circuit in circuits]) == ([], set())
+
+def test_new_circuits_and_devices_are_changed():
+    known = [_circuit("c1", "s1", ["v1"])]
+    grown = _circuit("c1", "s1", ["v1", "v2"])
+    added = _circuit("c2", "s2")
+    assert topology_changes(known, [grown, added]) == ([grown, added], set())
+
+def test_removed_circuits_and_devices_are_reported():
+    known = [_circuit("c1", "s1", ["v1", "v2"]), _circuit("c2", "s2")]
+    shrunk = _circuit("c1", "s1", ["v1"])
+    changed, removed = topology_changes(known, [shrunk])
+    assert removed == {"v2", "c2", "s2"}
+
+def test_first_topology_changes_every_circuit():
+    circuits = [_circuit("c1", "s1")]
+    assert topology_changes(None, circuits) == (circuits, set())
+
+def test_topology_ids_cover_circuits_sensors_and_valves():
+    assert topology_ids([_circuit("c1", "s1", ["v1", "v2"]), _circuit("c2")]) == {"c1", "s1", "v1", "v2", "c2"}
+    assert topology_ids(None) == set()
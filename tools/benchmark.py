@@ -0,0 +1,194 @@
+"""Micro-benchmarks for the MIYO Cube integration hot paths, no cube or Home Assistant needed.
+
+    python tools/benchmark.py
+    python tools/benchmark.py --json bench.json
+    python tools/benchmark.py --compare bench.json
+
+Reports per-call latency percentiles and the peak memory allocated per call
+for message parsing, value conversion, topology parsing and entity dispatch
+at 10, 100 and 1000 simulated devices.
+"""
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import types
+
+import payloads
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMPONENT_DIR = os.path.join(ROOT, "custom_components", "miyocube")
+SIZES = (10, 100, 1000)
+
+def load_component():
+    """Import the Home Assistant independent modules of the integration without running its __init__."""
+    package = types.ModuleType("miyocube")
+    package.__path__ = [COMPONENT_DIR]
+    sys.modules["miyocube"] = package
+    return types.SimpleNamespace(
+        utils=importlib.import_module("miyocube.utils"),
+        dispatcher=importlib.import_module("miyocube.dispatcher"),
+        state_store=importlib.import_module("miyocube.state_store"),
+    )
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def run(name, fn, inputs, min_calls=20000, alloc_samples=200):
+    """Time fn over inputs, cycling until min_calls calls were made, then sample allocations."""
+    perf_counter_ns = time.perf_counter_ns
+    # Warm up caches and the specializing interpreter
+    for item in inputs[:1000]:
+        fn(item)
+
+    timings = []
+    calls = 0
+    while calls < min_calls:
+        for item in inputs:
+            start = perf_counter_ns()
+            fn(item)
+            timings.append(perf_counter_ns() - start)
+        calls += len(inputs)
+    timings.sort()
+
+    tracemalloc.start()
+    peaks = []
+    for item in inputs[:alloc_samples]:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn(item)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+
+    return {
+        "name": name,
+        "calls": len(timings),
+        "mean_ns": round(statistics.fmean(timings)),
+        "p50_ns": percentile(timings, 0.50),
+        "p90_ns": percentile(timings, 0.90),
+        "p99_ns": percentile(timings, 0.99),
+        "max_ns": timings[-1],
+        "peak_alloc_bytes": round(statistics.fmean(peaks)) if peaks else 0,
+    }
+
+def bench_parse(component, messages):
+    return run("parse_ws_payload", component.utils.parse_ws_payload, messages)
+
+def bench_decode_and_parse(component, messages):
+    utils = component.utils
+    frames = [json.dumps(message) for message in messages]
+    return run("json_loads+parse_ws_payload", lambda frame: utils.parse_ws_payload(utils.json_loads(frame)), frames)
+
+def bench_convert(component):
+    convert = component.utils.convert_statetype_value
+    inputs = [
+        ("moisture", "42"), ("temperature", 17), ("brightness", "15320"), ("solarVoltage", "3.71"),
+        ("lastUpdate", "1700000000"), ("valveStatus", "true"), ("automaticMode", True), ("circuitName", "Beds"),
+    ] * 500
+    return run("convert_statetype_value", lambda args: convert(*args), inputs)
+
+def bench_parse_circuits(component, devices):
+    response = payloads.circuit_all_response(payloads.build_topology(devices))
+    parse = component.utils.parse_circuits
+    updates = component.utils.circuit_updates
+    return [
+        run(f"parse_circuits[{devices}]", parse, [response], min_calls=max(20, 2000 // devices), alloc_samples=5),
+        run(f"circuit_updates[{devices}]", updates, [parse(response)], min_calls=max(20, 2000 // devices), alloc_samples=5),
+    ]
+
+def bench_dispatch(component, devices):
+    """Dispatch parsed updates to one subscribed listener per (device, state type), as the entities do."""
+    utils = component.utils
+    topology = payloads.build_topology(devices)
+    circuits = utils.parse_circuits(payloads.circuit_all_response(topology))
+
+    store = component.state_store.MiyoStateStore()
+    dispatcher = component.dispatcher.MiyoDispatcher(store)
+    dispatcher.seed(utils.circuit_updates(circuits))
+
+    delivered = [0]
+    def listener(value):
+        delivered[0] += 1
+
+    for update in utils.circuit_updates(circuits):
+        dispatcher.subscribe(update["device_id"], update["state_type"], listener)
+
+    messages = payloads.notification_stream(topology, 5000)
+    batches = [utils.parse_ws_payload(message) for message in messages]
+    frames = [json.dumps(message) for message in messages]
+
+    return [
+        run(f"dispatch[{devices}]", dispatcher.dispatch, batches),
+        run(f"end_to_end[{devices}]", lambda frame: dispatcher.dispatch(utils.parse_ws_payload(utils.json_loads(frame))), frames),
+    ]
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_table(results, baseline=None):
+    previous = {result["name"]: result for result in (baseline or {}).get("results", [])}
+    header = f"{'benchmark':32} {'p50 ns':>10} {'p90 ns':>10} {'p99 ns':>10} {'mean ns':>10} {'peak B':>8}"
+    if previous:
+        header += f" {'Δp50':>8}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        line = f"{result['name']:32} {result['p50_ns']:>10} {result['p90_ns']:>10} {result['p99_ns']:>10} {result['mean_ns']:>10} {result['peak_alloc_bytes']:>8}"
+        old = previous.get(result["name"])
+        if old and old["p50_ns"]:
+            line += f" {100 * (result['p50_ns'] - old['p50_ns']) / old['p50_ns']:>+7.1f}%"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--json", metavar="PATH", help="write machine-readable results to PATH")
+    parser.add_argument("--compare", metavar="PATH", help="show the p50 change against results from an earlier --json run")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="simulated device counts (default: %(default)s)")
+    args = parser.parse_args()
+
+    component = load_component()
+    messages = payloads.notification_stream(payloads.build_topology(100), 5000)
+
+    results = [
+        bench_parse(component, messages),
+        bench_decode_and_parse(component, messages),
+        bench_convert(component),
+    ]
+    for devices in args.sizes:
+        results.extend(bench_parse_circuits(component, devices))
+        results.extend(bench_dispatch(component, devices))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    if args.json:
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "implementation": platform.python_implementation(),
+                "machine": platform.machine(),
+                "json_loads": f"{component.utils.json_loads.__module__}.{component.utils.json_loads.__name__}",
+            },
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Payload shapes recorded from a MIYO Cube, generated for arbitrary topology sizes.
+
+Used by the benchmarks and the cube simulator, so both exercise the same
+message layouts the integration sees on a real installation.
+"""
+import random
+import time
+import uuid
+
+SENSOR_STATE_TYPES = ("moisture", "temperature", "brightness", "solarVoltage")
+VALVE_STATE_TYPES = ("solarVoltage", "valveStatus")
+
+def _guid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+def _ipv6(rng):
+    return f"fd00::{rng.getrandbits(16):x}:{rng.getrandbits(16):x}:{rng.getrandbits(16):x}%zmd0"
+
+def _state_types(rng, values: dict) -> dict:
+    """stateTypes are keyed by a GUID on the cube, with the type name inside."""
+    return {"{" + _guid(rng) + "}": {"type": state_type, "value": value} for state_type, value in values.items()}
+
+def sensor_values(rng) -> dict:
+    return {
+        "moisture": rng.randint(5, 95),
+        "temperature": rng.randint(-5, 40),
+        "brightness": rng.randint(0, 100000),
+        "solarVoltage": round(rng.uniform(2.8, 4.2), 2),
+    }
+
+def build_topology(devices: int, valves_per_circuit: int = 2, seed: int = 1) -> dict:
+    """Build the params of a /api/circuit/all response with about `devices` sensors and valves."""
+    rng = random.Random(seed)
+    now = int(time.time())
+    circuits = {}
+    per_circuit = 1 + valves_per_circuit
+    for index in range(max(1, round(devices / per_circuit))):
+        valves = {}
+        for channel in range(valves_per_circuit):
+            hardware_revision = rng.choice((0, 1))
+            values = {"solarVoltage": round(rng.uniform(2.8, 4.2), 2), "valveStatus": False}
+            if hardware_revision == 1:
+                values["valve2Status"] = False
+            valves["{" + _guid(rng) + "}"] = {
+                "channel": channel,
+                "valveData": {
+                    "id": _guid(rng),
+                    "ipv6": _ipv6(rng),
+                    "lastUpdate": str(now - rng.randint(0, 900)),
+                    "hardwareRevision": hardware_revision,
+                    "stateTypes": _state_types(rng, values),
+                },
+            }
+        circuits["{" + _guid(rng) + "}"] = {
+            "name": f"Circuit {index + 1}",
+            "stateTypes": _state_types(rng, {"irrigationWasStarted": False}),
+            "params": {"automaticMode": rng.choice((True, False)), "valveStaggering": False},
+            "sensorData": {
+                "id": _guid(rng),
+                "ipv6": _ipv6(rng),
+                "lastUpdate": str(now - rng.randint(0, 900)),
+                "stateTypes": _state_types(rng, sensor_values(rng)),
+            },
+            "valves": valves,
+        }
+    return {"circuits": circuits}
+
+def circuit_all_response(topology: dict) -> dict:
+    return {"id": 0, "status": "success", "params": topology}
+
+def iter_devices(topology: dict):
+    """Yield (circuit_id, device_id, kind, hardware_revision) for every sensor and valve."""
+    for circuit_id, circuit in topology["circuits"].items():
+        sensor_id = circuit.get("sensorData", {}).get("id")
+        if sensor_id:
+            yield circuit_id, sensor_id, "sensor", None
+        for valve in circuit.get("valves", {}).values():
+            valve_data = valve["valveData"]
+            yield circuit_id, valve_data["id"], "valve", valve_data.get("hardwareRevision")
+
+def device_state_changed(device_id: str, state_type: str, value) -> dict:
+    return {"notification": "Device.stateChanged", "params": {"deviceId": "{" + device_id + "}", "type": state_type, "value": value}}
+
+def device_updated(device_id: str, timestamp: float) -> dict:
+    return {"notification": "Device.updated", "params": {"id": "{" + device_id + "}", "lastUpdate": str(int(timestamp))}}
+
+def circuit_state_changed(circuit_id: str, state_type: str, value) -> dict:
+    return {"notification": "Circuit.stateChanged", "params": {"circuitId": circuit_id, "type": state_type, "value": value}}
+
+def circuit_edited(circuit_id: str, circuit: dict) -> dict:
+    return {"notification": "Circuit.edited", "params": {"circuit": {"id": circuit_id, "name": circuit.get("name"), "params": dict(circuit.get("params", {}))}}}
+
+def sensor_burst(rng, device_id: str, timestamp: float) -> list:
+    """The notifications a sensor node produces when it reports: its state types, then Device.updated."""
+    return [device_state_changed(device_id, state_type, value) for state_type, value in sensor_values(rng).items()] + [device_updated(device_id, timestamp)]
+
+def notification_stream(topology: dict, count: int, seed: int = 2) -> list:
+    """A realistic mix of notifications: mostly sensor bursts, some valve and circuit changes."""
+    rng = random.Random(seed)
+    devices = list(iter_devices(topology))
+    circuit_ids = list(topology["circuits"])
+    now = time.time()
+    messages = []
+    while len(messages) < count:
+        roll = rng.random()
+        if roll < 0.8:
+            _, device_id, kind, _ = rng.choice(devices)
+            if kind == "sensor":
+                messages.extend(sensor_burst(rng, device_id, now))
+            else:
+                messages.append(device_state_changed(device_id, "solarVoltage", round(rng.uniform(2.8, 4.2), 2)))
+                messages.append(device_updated(device_id, now))
+        elif roll < 0.95:
+            messages.append(circuit_state_changed(rng.choice(circuit_ids), "irrigationWasStarted", rng.choice((True, False))))
+        else:
+            circuit_id = rng.choice(circuit_ids)
+            messages.append(circuit_edited(circuit_id, topology["circuits"][circuit_id]))
+    return messages[:count]
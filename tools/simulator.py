@@ -0,0 +1,284 @@
+"""Stand-in MIYO Cube for load and soak testing the integration without hardware.
+
+Serves the HTTP API (/api/System/status, /api/circuit/all, /api/link) and the
+JSON-RPC WebSocket on port 3810, accepts Circuit.edit and Circuit.irrigation
+and emits Device.stateChanged, Device.updated, Circuit.stateChanged and
+Circuit.edited at a configurable rate for a configurable topology size,
+circuit notifications both in reply to commands and as part of the stream.
+
+    python tools/simulator.py --host 127.0.0.2 --devices 300 --rate 2000
+    python tools/simulator.py --disconnect-every 60 --malformed-rate 0.01 --http-delay 3000
+
+The integration expects the HTTP API on port 80 and the socket on port 3810
+of the same host, so bind to a spare loopback address and allow binding
+port 80 (e.g. run as root or grant CAP_NET_BIND_SERVICE).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+
+import websockets
+from aiohttp import web
+
+import payloads
+
+_LOGGER = logging.getLogger("miyo_simulator")
+
+class CubeSimulator:
+    """Simulated cube state, HTTP handlers and WebSocket broadcaster."""
+
+    def __init__(self, args):
+        self.args           = args
+        self.api_key        = args.api_key
+        self.uuid           = str(uuid.uuid4())
+        self.topology       = payloads.build_topology(args.devices, args.valves_per_circuit, seed=args.seed)
+        self.rng            = random.Random(args.seed)
+        self.clients        = set()
+        self.sent           = 0
+        self.irrigation     = {}
+
+        # (device_id, state_type) -> stateTypes entry, so emitted values also show up in /api/circuit/all
+        self._entries = {}
+        self._devices = {}
+        for circuit_id, circuit in self.topology["circuits"].items():
+            circuit_key = circuit_id.strip("{}")
+            for entry in circuit["stateTypes"].values():
+                self._entries[(circuit_key, entry["type"])] = entry
+            sensor = circuit["sensorData"]
+            self._devices[sensor["id"]] = sensor
+            for entry in sensor["stateTypes"].values():
+                self._entries[(sensor["id"], entry["type"])] = entry
+            for valve in circuit["valves"].values():
+                valve_data = valve["valveData"]
+                self._devices[valve_data["id"]] = valve_data
+                for entry in valve_data["stateTypes"].values():
+                    self._entries[(valve_data["id"], entry["type"])] = entry
+        self._device_list = list(payloads.iter_devices(self.topology))
+        self._circuit_list = list(self.topology["circuits"].items())
+
+    #
+    #  ---------- HTTP API ----------
+    #
+
+    async def _delay(self):
+        if self.args.http_delay:
+            await asyncio.sleep(self.args.http_delay / 1000)
+
+    def _authorized(self, request) -> bool:
+        return request.query.get("apiKey") == self.api_key
+
+    async def handle_status(self, request):
+        await self._delay()
+        if not self._authorized(request):
+            return web.json_response({"status": "error", "error": "unauthorized"}, status=401)
+        return web.json_response({"id": 0, "status": "success", "params": {"uuid": self.uuid, "name": "MIYO Cube Simulator"}})
+
+    async def handle_circuits(self, request):
+        await self._delay()
+        if not self._authorized(request):
+            return web.json_response({"status": "error", "error": "unauthorized"}, status=401)
+        return web.json_response(payloads.circuit_all_response(self.topology))
+
+    async def handle_link(self, request):
+        await self._delay()
+        return web.json_response({"apiKey": self.api_key})
+
+    #
+    #  ---------- WebSocket ----------
+    #
+
+    async def handle_socket(self, ws):
+        self.clients.add(ws)
+        _LOGGER.info("Client connected (%s total)", len(self.clients))
+        try:
+            async for frame in ws:
+                await self._handle_command(ws, frame)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.clients.discard(ws)
+            _LOGGER.info("Client disconnected (%s total)", len(self.clients))
+
+    async def _handle_command(self, ws, frame):
+        try:
+            request = json.loads(frame)
+        except ValueError:
+            return
+        request_id = request.get("id")
+        if request.get("apiKey") != self.api_key:
+            await self._respond(ws, request_id, error="unauthorized")
+            return
+
+        method = request.get("method")
+        params = request.get("params", {})
+        circuit = self.topology["circuits"].get("{" + str(params.get("circuitId", "")).strip("{}") + "}")
+        if circuit is None:
+            await self._respond(ws, request_id, error="unknown circuit")
+            return
+
+        if method == "Circuit.edit":
+            for key in ("automaticMode", "valveStaggering"):
+                if key in params:
+                    circuit["params"][key] = bool(params[key])
+            await self._respond(ws, request_id)
+            circuit_id = "{" + params["circuitId"].strip("{}") + "}"
+            self.broadcast([payloads.circuit_edited(circuit_id, circuit)])
+        elif method == "Circuit.irrigation":
+            await self._respond(ws, request_id)
+            self._set_irrigation(params["circuitId"].strip("{}"), circuit, params.get("mode") == "start", params.get("duration", 1))
+        else:
+            await self._respond(ws, request_id, error=f"unknown method {method}")
+
+    async def _respond(self, ws, request_id, error=None):
+        if self.args.response_delay:
+            await asyncio.sleep(self.args.response_delay / 1000)
+        response = {"id": request_id, "status": "error", "error": error} if error else {"id": request_id, "status": "success", "params": {}}
+        try:
+            await ws.send(json.dumps(response))
+        except websockets.ConnectionClosed:
+            pass
+
+    def _set_irrigation(self, circuit_key, circuit, active, duration):
+        """Open or close the valves of a circuit and announce the change."""
+        self.broadcast(self._irrigate(circuit_key, circuit, active, duration))
+
+    def _irrigate(self, circuit_key, circuit, active, duration):
+        """Open or close the valves of a circuit, returns the notifications announcing it."""
+        timer = self.irrigation.pop(circuit_key, None)
+        if timer:
+            timer.cancel()
+
+        messages = [self._set_state(circuit_key, "irrigationWasStarted", active, circuit=True)]
+        for valve in circuit["valves"].values():
+            messages.append(self._set_state(valve["valveData"]["id"], "valveStatus", active))
+
+        if active:
+            seconds = float(duration) * 60 * self.args.time_scale
+            self.irrigation[circuit_key] = asyncio.get_running_loop().call_later(seconds, self._set_irrigation, circuit_key, circuit, False, 0)
+        return messages
+
+    def _set_state(self, device_id, state_type, value, circuit=False):
+        entry = self._entries.get((device_id, state_type))
+        if entry is not None:
+            entry["value"] = value
+        if circuit:
+            return payloads.circuit_state_changed("{" + device_id + "}", state_type, value)
+        return payloads.device_state_changed(device_id, state_type, value)
+
+    def broadcast(self, messages):
+        """Send messages to every connected client, occasionally corrupting one if requested."""
+        if not self.clients:
+            return
+        for message in messages:
+            frame = json.dumps(message)
+            if self.args.malformed_rate and self.rng.random() < self.args.malformed_rate:
+                frame = frame[: self.rng.randint(1, len(frame) - 1)]
+            websockets.broadcast(self.clients, frame)
+            self.sent += 1
+
+    #
+    #  ---------- Load generation and fault injection ----------
+    #
+
+    def _telemetry(self, count):
+        """Produce about count notifications, mostly sensor bursts and some circuit changes, and apply them to the topology."""
+        messages = []
+        now = time.time()
+        while len(messages) < count:
+            if self.rng.random() < self.args.circuit_share:
+                messages.extend(self._circuit_change())
+                continue
+            _, device_id, kind, _ = self.rng.choice(self._device_list)
+            values = payloads.sensor_values(self.rng) if kind == "sensor" else {"solarVoltage": round(self.rng.uniform(2.8, 4.2), 2)}
+            for state_type, value in values.items():
+                messages.append(self._set_state(device_id, state_type, value))
+            self._devices[device_id]["lastUpdate"] = str(int(now))
+            messages.append(payloads.device_updated(device_id, now))
+        return messages
+
+    def _circuit_change(self):
+        """Start or end an irrigation like an automatic schedule would, or toggle a circuit param like the app would."""
+        circuit_id, circuit = self.rng.choice(self._circuit_list)
+        circuit_key = circuit_id.strip("{}")
+        if self.rng.random() < 0.75:
+            return self._irrigate(circuit_key, circuit, circuit_key not in self.irrigation, self.rng.choice((1, 5, 15)))
+        key = self.rng.choice(("automaticMode", "valveStaggering"))
+        circuit["params"][key] = not circuit["params"][key]
+        return [payloads.circuit_edited(circuit_id, circuit)]
+
+    async def emit_loop(self):
+        tick = 0.05
+        budget = 0.0
+        while True:
+            await asyncio.sleep(tick)
+            budget += self.args.rate * tick
+            count = int(budget)
+            if count:
+                budget -= count
+                self.broadcast(self._telemetry(count))
+
+    async def disconnect_loop(self):
+        while True:
+            await asyncio.sleep(self.args.disconnect_every)
+            _LOGGER.warning("Injecting disconnect of %s clients", len(self.clients))
+            for ws in tuple(self.clients):
+                await ws.close(code=1011, reason="simulated disconnect")
+
+    async def stats_loop(self):
+        last = self.sent
+        while True:
+            await asyncio.sleep(10)
+            _LOGGER.info("%s clients, %.0f msg/s", len(self.clients), (self.sent - last) / 10)
+            last = self.sent
+
+async def serve(args):
+    simulator = CubeSimulator(args)
+
+    app = web.Application()
+    app.router.add_get("/api/System/status", simulator.handle_status)
+    app.router.add_get("/api/circuit/all", simulator.handle_circuits)
+    app.router.add_get("/api/link", simulator.handle_link)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, args.host, args.http_port).start()
+
+    async with websockets.serve(simulator.handle_socket, args.host, args.ws_port, max_size=None):
+        _LOGGER.info(
+            "Simulating cube %s with %s circuits on http://%s:%s and ws://%s:%s, api key %s",
+            simulator.uuid, len(simulator.topology["circuits"]), args.host, args.http_port, args.host, args.ws_port, args.api_key,
+        )
+        tasks = [simulator.emit_loop(), simulator.stats_loop()]
+        if args.disconnect_every:
+            tasks.append(simulator.disconnect_loop())
+        await asyncio.gather(*tasks)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--http-port", type=int, default=80)
+    parser.add_argument("--ws-port", type=int, default=3810)
+    parser.add_argument("--api-key", default="simulator")
+    parser.add_argument("--devices", type=int, default=30, help="number of sensors and valves (default: %(default)s)")
+    parser.add_argument("--valves-per-circuit", type=int, default=2)
+    parser.add_argument("--rate", type=float, default=10, help="notifications per second (default: %(default)s)")
+    parser.add_argument("--circuit-share", type=float, default=0.05, help="fraction of notifications starting or ending irrigations and editing circuits (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--time-scale", type=float, default=1.0, help="factor applied to irrigation durations")
+    parser.add_argument("--disconnect-every", type=float, default=0, help="close all sockets every N seconds")
+    parser.add_argument("--malformed-rate", type=float, default=0, help="fraction of frames sent truncated")
+    parser.add_argument("--http-delay", type=float, default=0, help="delay of every HTTP response in ms")
+    parser.add_argument("--response-delay", type=float, default=0, help="delay of every command response in ms")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()